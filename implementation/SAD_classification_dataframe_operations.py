@@ -1,14 +1,22 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from anytree import Node, RenderTree, find_by_attr
+from functools import lru_cache
+from itertools import islice
+from anytree import Node, PreOrderIter, RenderTree
+from joblib import effective_n_jobs
 import nltk
 from nltk.tokenize import RegexpTokenizer, word_tokenize
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords, wordnet
-from nltk.tag import pos_tag
+from nltk.tag import PerceptronTagger
 import re
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from prettytable import PrettyTable
+from classification_scheme import CompiledClassificationScheme
+from instrumentation import instrumentation, instrumented, run_in_worker
 
 
 class LevelOfClassification(Enum):
@@ -55,14 +63,30 @@ class TextPreprocessor:
     preprocessing, namely removing special characters and digits, do lowercasing, removing stop words and do stemming
     and lemmatisation.
     """
-    def __init__(self):
+    __HTML_TAG_PATTERN = re.compile('<.*?>')
+    __URL_PATTERN = re.compile(r'http\S+')
+    __DIGIT_PATTERN = re.compile('[0-9]+')
+
+    def __init__(self, download_resources=True, lemma_cache_size=65536):
         """
         Constructor for a TextProprocessor. To initialize the preprocessor, vocabulary und tokens from NLTK will be
-        downloaded.
-        """
-        nltk.download('wordnet')
-        nltk.download('punkt')
-        nltk.download('stopwords')
+        downloaded. Tokenizer, lemmatizer, tagger and stop words are created once per preprocessor and reused for all
+        sentences.
+        :param download_resources: if set to false, nothing will be downloaded and the NLTK resources must already be
+                installed locally (offline mode, e.g. for workers without network access)
+        :param lemma_cache_size: maximum number of (word, POS tag) pairs whose lemma is memorized
+        """
+        if download_resources:
+            nltk.download('wordnet')
+            nltk.download('punkt')
+            nltk.download('stopwords')
+            instrumentation.count('nltk_download', 3)
+        self.__tokenizer = RegexpTokenizer(r'\w+')
+        self.__lemmatizer = WordNetLemmatizer()
+        self.__lemma_cache_size = lemma_cache_size
+        self.__lemmatize = lru_cache(maxsize=lemma_cache_size)(self.__lemmatizer.lemmatize)
+        self.__stop_words = None
+        self.__tagger = None
 
     def preprocess(self, sentence: str, do_cleanup=False, do_lowercasing=False, do_stop_word_removal=False,
                    do_lemmatization=False):
@@ -78,36 +102,53 @@ class TextPreprocessor:
 
         See: https://stackoverflow.com/a/54398984
         """
-        sentence = str(sentence)
-        if do_lowercasing:
-            sentence = sentence.lower()
-        if do_cleanup:
-            sentence = sentence.replace('{html}', "")
-            cleanr = re.compile('<.*?>')
-            cleantext = re.sub(cleanr, '', sentence)
-            rem_url = re.sub(r'http\S+', '', cleantext)
-            rem_num = re.sub('[0-9]+', '', rem_url)
-            tokenizer = RegexpTokenizer(r'\w+')
-            tokens = tokenizer.tokenize(rem_num)
-        else:
-            tokens = word_tokenize(sentence)
+        return self.preprocess_batch([sentence], do_cleanup, do_lowercasing, do_stop_word_removal, do_lemmatization)[0]
 
-        if do_stop_word_removal:
-            filtered_words = [w for w in tokens if not w in stopwords.words('english')]
-        else:
-            filtered_words = [w for w in tokens]
-        
-        if do_lemmatization:
-            pos_tags=pos_tag(filtered_words)
-            lemmatizer = WordNetLemmatizer()
-            lemma_words = [lemmatizer.lemmatize(w,self.get_wordnet_pos(pos_tag)) for (w,pos_tag) in pos_tags]
-
-        else:
-            lemma_words = filtered_words
-
-        return " ".join(lemma_words)
+    @instrumented('TextPreprocessor.preprocess_batch')
+    def preprocess_batch(self, sentences, do_cleanup=False, do_lowercasing=False, do_stop_word_removal=False,
+                         do_lemmatization=False, batch_size=1000, n_jobs=1, chunk_size=500):
+        """
+        Applies preprocess() to all given sentences. The sentences are processed in batches, so that POS tagging is
+        done for a whole batch at once and the memory stays bounded for large iterables.
+        With 'n_jobs' other than 1, the sentences are split into chunks of 'chunk_size' sentences which are preprocessed
+        by a pool of worker processes. Each worker initializes its own preprocessor (and thereby the NLTK resources)
+        once. The result is the same as in the serial mode.
+        :param sentences: iterable of inputs which will be transformed with given techniques
+        :param do_cleanup: if set to true, special characters, digits and hyperlinks will be removed
+        :param do_lowercasing: if set to true, all characters will be lowercased
+        :param do_stop_word_removal: if set to true, stop words from NLKT.corpus.stopwords will be removed
+        :param do_lemmatization: if set to true, words will be reduced to their lemma
+        :param batch_size: number of sentences which are processed together
+        :param n_jobs: number of worker processes, -1 uses all available CPUs (-2 all but one etc.)
+        :param chunk_size: number of sentences which are sent to a worker process at once
+        :return: list of sentences after applying the preprocessing techniques, in the order of the input
+        :raises ValueError: If 'n_jobs' is 0.
+        """
+        preprocessing_flags = (do_cleanup, do_lowercasing, do_stop_word_removal, do_lemmatization, batch_size)
+        n_jobs = effective_n_jobs(n_jobs)
+        if n_jobs != 1:
+            return self.__preprocess_in_parallel(sentences, preprocessing_flags, n_jobs, chunk_size)
+        preprocessed_sentences = []
+        iterator = iter(sentences)
+        batch = list(islice(iterator, batch_size))
+        while batch:
+            with instrumentation.stage('TextPreprocessor.tokenization'):
+                tokenized_sentences = [self.__tokenize(sentence, do_cleanup, do_lowercasing) for sentence in batch]
+            if do_stop_word_removal:
+                with instrumentation.stage('TextPreprocessor.stop_word_removal'):
+                    stop_words = self.__get_stop_words()
+                    tokenized_sentences = [[w for w in tokens if w not in stop_words]
+                                           for tokens in tokenized_sentences]
+            if do_lemmatization:
+                with instrumentation.stage('TextPreprocessor.pos_tagging'):
+                    tagged_sentences = self.__get_tagger().tag_sents(tokenized_sentences)
+                with instrumentation.stage('TextPreprocessor.lemmatization'):
+                    tokenized_sentences = [[self.__lemmatize(w, self.get_wordnet_pos(pos_tag))
+                                            for (w, pos_tag) in tags] for tags in tagged_sentences]
+            preprocessed_sentences.extend(" ".join(tokens) for tokens in tokenized_sentences)
+            batch = list(islice(iterator, batch_size))
+        return preprocessed_sentences
 
-    
     def get_wordnet_pos(self,treebank_tag):
         """
         Use this method to convert treebank POS tag to WordNet format
@@ -126,6 +167,98 @@ class TextPreprocessor:
             # Use noun as default
             return wordnet.NOUN
 
+    def __preprocess_in_parallel(self, sentences, preprocessing_flags: tuple, n_jobs: int, chunk_size: int):
+        """
+        Distributes the sentences in chunks over a process pool and collects the results in the order of the input.
+        At most two chunks per worker are submitted at once, so that only a bounded part of the input is read ahead.
+        :param sentences: iterable of inputs which will be transformed
+        :param preprocessing_flags: positional arguments for preprocess_batch() after the sentences
+        :param n_jobs: number of worker processes (positive, see joblib.effective_n_jobs)
+        :param chunk_size: number of sentences which are sent to a worker process at once
+        :return: list of preprocessed sentences
+        """
+        iterator = iter(sentences)
+        chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+        preprocessed_sentences = []
+        submitted_chunks = deque()
+
+        def collect_oldest_chunk():
+            preprocessed_chunk, records = submitted_chunks.popleft().result()
+            preprocessed_sentences.extend(preprocessed_chunk)
+            instrumentation.merge(records)
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_initialize_preprocessing_worker,
+                                 initargs=(self.__lemma_cache_size,)) as executor:
+            for chunk in chunks:
+                submitted_chunks.append(executor.submit(run_in_worker, instrumentation.enabled, _preprocess_chunk,
+                                                        chunk, preprocessing_flags))
+                if len(submitted_chunks) >= 2 * n_jobs:
+                    collect_oldest_chunk()
+            while submitted_chunks:
+                collect_oldest_chunk()
+        return preprocessed_sentences
+
+    def __tokenize(self, sentence: str, do_cleanup: bool, do_lowercasing: bool):
+        """
+        Splits the sentence into tokens after lowercasing and cleaning it up, depending on the configuration.
+        :param sentence: input which will be tokenized
+        :param do_cleanup: if set to true, special characters, digits and hyperlinks will be removed
+        :param do_lowercasing: if set to true, all characters will be lowercased
+        :return: list of tokens
+        """
+        sentence = str(sentence)
+        if do_lowercasing:
+            sentence = sentence.lower()
+        if do_cleanup:
+            sentence = sentence.replace('{html}', "")
+            cleantext = self.__HTML_TAG_PATTERN.sub('', sentence)
+            rem_url = self.__URL_PATTERN.sub('', cleantext)
+            rem_num = self.__DIGIT_PATTERN.sub('', rem_url)
+            return self.__tokenizer.tokenize(rem_num)
+        return word_tokenize(sentence)
+
+    def __get_stop_words(self):
+        """
+        Loads the English stop words from NLTK.corpus.stopwords on first use.
+        :return: frozenset of stop words
+        """
+        if self.__stop_words is None:
+            self.__stop_words = frozenset(stopwords.words('english'))
+            instrumentation.count('nltk_resource_load')
+        return self.__stop_words
+
+    def __get_tagger(self):
+        """
+        Loads the POS tagger which is also used by nltk.tag.pos_tag on first use.
+        :return: nltk.tag.PerceptronTagger
+        """
+        if self.__tagger is None:
+            self.__tagger = PerceptronTagger()
+            instrumentation.count('nltk_resource_load')
+        return self.__tagger
+
+
+_worker_text_preprocessor = None
+
+
+def _initialize_preprocessing_worker(lemma_cache_size: int):
+    """
+    Initializer for the worker processes of TextPreprocessor.preprocess_batch(). Creates the preprocessor of the worker
+    once without downloading resources, as they have already been provided by the parent process.
+    :param lemma_cache_size: maximum number of (word, POS tag) pairs whose lemma is memorized
+    """
+    global _worker_text_preprocessor
+    _worker_text_preprocessor = TextPreprocessor(download_resources=False, lemma_cache_size=lemma_cache_size)
+
+
+def _preprocess_chunk(sentences: list, preprocessing_flags: tuple):
+    """
+    Preprocesses one chunk of sentences in a worker process.
+    :param sentences: list of inputs which will be transformed
+    :param preprocessing_flags: positional arguments for preprocess_batch() after the sentences
+    :return: list of preprocessed sentences
+    """
+    return _worker_text_preprocessor.preprocess_batch(sentences, *preprocessing_flags)
 
 
 class LabelPreprocessor:
@@ -133,13 +266,18 @@ class LabelPreprocessor:
     LabelPreprocessor provides functionality to preprocess labels in a pandas.DataFrame. For different learning
     algorithms and the use of machine learning libraries specific labelling is necessary, e.g. integer labels.
     """
+    LABEL_INDEX_CACHE_SIZE = 32
+
     def __init__(self):
         """
         Default constructor for LabelPreprocessor. LabelPreprocessor objects can be used preprocess labels from a
-        pandas.DataFrame.
+        pandas.DataFrame. Label indices are compiled lazily and cached per structure of the classification scheme,
+        level of classification and label for unrelated items. Only the LABEL_INDEX_CACHE_SIZE most recently used
+        label indices are kept.
         """
-        pass
+        self.__label_indices = OrderedDict()
 
+    @instrumented('LabelPreprocessor.transform_df_unified_labels')
     def transform_df_unified_labels(self, df: pd.DataFrame, column_name: str, classification_scheme: Node,
                                     level_of_classification: LevelOfClassification, label_unrelated: str):
         """
@@ -155,12 +293,37 @@ class LabelPreprocessor:
         :param label_unrelated: Name for all items that do not fit any class on the selected level of classification.
         :return: Transformed corpus where labels are in given column are only from given level or label_unrelated
         """
+        label_index = self.get_label_index(classification_scheme, level_of_classification, label_unrelated)
         corpus_transformed = df.copy()
-        for index, row in corpus_transformed.iterrows():
-            row[column_name] = self.__adjust_label(classification_scheme, level_of_classification, row[column_name],
-                                                   label_unrelated)
+        corpus_transformed[column_name] = self.__resolve_labels(corpus_transformed[column_name], label_index,
+                                                                label_unrelated)
         return corpus_transformed
 
+    def get_label_index(self, classification_scheme: Node, level_of_classification: LevelOfClassification,
+                        label_unrelated: str):
+        """
+        Returns a dictionary which maps every class name of the 'classification_scheme' to the class on the selected
+        'level_of_classification' it belongs to. The index is compiled from a CompiledClassificationScheme of the
+        scheme and cached under the structure of the scheme, so that further calls with an equal scheme reuse it and
+        a scheme which was changed after its first use is compiled again.
+        :param classification_scheme: Root node of hierarchical scheme or its CompiledClassificationScheme.
+        :param level_of_classification: Selection of enumeration LevelOfClassification representing the names of the
+                selected classes.
+        :param label_unrelated: Label which should be used if none from the scheme fits.
+        :return: Dictionary which maps a label to the name of its class on the selected level. Labels which do not fit
+                 any class are not contained and should be mapped to 'label_unrelated'.
+        """
+        key = (self.__fingerprint_scheme(classification_scheme), level_of_classification, label_unrelated)
+        label_index = self.__label_indices.get(key)
+        if label_index is None:
+            label_index = self.__compile_label_index(classification_scheme, level_of_classification)
+            self.__label_indices[key] = label_index
+            if len(self.__label_indices) > self.LABEL_INDEX_CACHE_SIZE:
+                self.__label_indices.popitem(last=False)
+        else:
+            self.__label_indices.move_to_end(key)
+        return label_index
+
     def generate_dictionary_for_integer_labels(self, categories, label_unrelated):
         """
         For learning algorithms, sometimes integer labels must be provided. Therefore, use this method to create a
@@ -177,6 +340,43 @@ class LabelPreprocessor:
             categories_with_integer_labels[category] = categories.index(category) + 1
         return categories_with_integer_labels
 
+    def generate_integer_label_mapping(self, classification_scheme, dictionary_for_integer_labels: dict,
+                                       level_of_classification: LevelOfClassification,
+                                       dictionary_for_level_of_classification: dict, label_unrelated: str):
+        """
+        Use this method to roll up integer labels (e.g. predictions on level LEAVES) to the classes on a coarser
+        'level_of_classification'. Each class is mapped to its (parent) class on the selected level with the
+        classification scheme. Classes outside of the subtrees of the selected level and 'label_unrelated' are mapped
+        to 'label_unrelated', like transform_df_unified_labels does.
+        :param classification_scheme: Root node of hierarchical scheme or its CompiledClassificationScheme.
+        :param dictionary_for_integer_labels: Matching between the classes and the integer labels to roll up.
+        :param level_of_classification: Element from enumeration LevelOfClassification which defines target labels.
+        :param dictionary_for_level_of_classification: Matching between the classes on the selected level and their
+                integer labels, see generate_dictionary_for_integer_labels.
+        :param label_unrelated: Name for the class which sums up all unrelated data points.
+        :return: numpy.ndarray which holds at index i the integer label on the selected level for integer label i.
+        :raises ValueError: If a class is a parent class of a class on the selected level, i.e. the selected level is
+                more fine-grained.
+        """
+        label_index = self.get_label_index(classification_scheme, level_of_classification, label_unrelated)
+        if not isinstance(classification_scheme, CompiledClassificationScheme):
+            classification_scheme = CompiledClassificationScheme(classification_scheme)
+        target_ids = [classification_scheme.get_id(category) for category in level_of_classification.value]
+        finer_classes = [category for category in dictionary_for_integer_labels
+                         if category not in label_index and category in classification_scheme.name_to_id
+                         and any(classification_scheme.is_descendant(target_id, classification_scheme.get_id(category))
+                                 for target_id in target_ids)]
+        if finer_classes:
+            raise ValueError("Cannot roll up " + str(finer_classes) + " to the more fine-grained level "
+                             + level_of_classification.name)
+        dtype = np.min_scalar_type(max(dictionary_for_level_of_classification.values(), default=0))
+        integer_label_mapping = np.zeros(max(dictionary_for_integer_labels.values(), default=0) + 1, dtype=dtype)
+        for category, integer_label in dictionary_for_integer_labels.items():
+            integer_label_mapping[integer_label] = dictionary_for_level_of_classification[
+                label_index.get(category, label_unrelated)]
+        return integer_label_mapping
+
+    @instrumented('LabelPreprocessor.transform_df_integer_labels')
     def transform_df_integer_labels(self, df: pd.DataFrame, column_name: str, dictionary_for_integer_labels: dict):
         """
         Transform every value in column with 'column_name' in pandas.DataFrame 'df' to a integer label. Integer labels
@@ -190,12 +390,35 @@ class LabelPreprocessor:
                     with integer value if a mapping in the dictionary exists.
         """
         df_with_integer_values = df.copy()
-        for index, row in df_with_integer_values.iterrows():
-            for label in dictionary_for_integer_labels:
-                if row[column_name] == label:
-                    row[column_name] = dictionary_for_integer_labels.get(label)
+        codes, uniques = pd.factorize(df_with_integer_values[column_name])
+        if (codes < 0).any():
+            # Missing values have no mapping and are kept, they are selected by the code -1.
+            uniques = list(uniques) + [np.nan]
+        replaced = [dictionary_for_integer_labels.get(label, label) for label in uniques]
+        df_with_integer_values[column_name] = np.array(replaced, dtype=object)[codes]
         return df_with_integer_values
 
+    @instrumented('LabelPreprocessor.encode_integer_labels')
+    def encode_integer_labels(self, df: pd.DataFrame, column_name: str, dictionary_for_integer_labels: dict):
+        """
+        Column-wise counterpart to transform_df_integer_labels which returns the integer labels of column
+        'column_name' as compact array instead of a copy of the DataFrame. The smallest unsigned integer type that can
+        hold all values of 'dictionary_for_integer_labels' is used.
+        :param df: The pandas.DataFrame which provides the labels.
+        :param column_name: The name of the column in 'df' with the textual labels.
+        :param dictionary_for_integer_labels: Matching between a textual label with a corresponding integer value.
+        :return: numpy.ndarray with one integer label per row of 'df'.
+        :raises ValueError: If a label in the column has no mapping in 'dictionary_for_integer_labels'.
+        """
+        codes, uniques = pd.factorize(df[column_name])
+        unknown_labels = [label for label in uniques if label not in dictionary_for_integer_labels]
+        if unknown_labels or (codes < 0).any():
+            raise ValueError("No integer label defined for: " + str(unknown_labels or [np.nan]))
+        dtype = np.min_scalar_type(max(dictionary_for_integer_labels.values(), default=0))
+        integer_labels = np.array([dictionary_for_integer_labels[label] for label in uniques], dtype=dtype)
+        return integer_labels[codes]
+
+    @instrumented('LabelPreprocessor.transform_df_multi_label')
     def transform_df_multi_label(self, df: pd.DataFrame, first_column_name: str, second_column_name: str,
                                  new_column_name: str, value_unrelated=0):
         """
@@ -212,70 +435,102 @@ class LabelPreprocessor:
                     vectors for multi label classification.
         """
         corpus_multi_label = df.copy()
-        corpus_multi_label[new_column_name] = ""
-        for index, row in corpus_multi_label.iterrows():
-            multi_label = []
-            multi_label.append(row[first_column_name])
-            if row[second_column_name] != value_unrelated and row[second_column_name] != row[first_column_name]:
-                multi_label.append(row[second_column_name])
-
-            row[new_column_name] = multi_label
+        first_labels = corpus_multi_label[first_column_name].to_numpy()
+        second_labels = corpus_multi_label[second_column_name].to_numpy()
+        use_second_label = self.__select_second_labels(first_labels, second_labels, value_unrelated)
+        multi_labels = np.empty(len(corpus_multi_label), dtype=object)
+        multi_labels[:] = [[first, second] if use_second else [first]
+                           for first, second, use_second in zip(first_labels, second_labels, use_second_label)]
+        corpus_multi_label[new_column_name] = multi_labels
         return corpus_multi_label
 
-    def __get_classes_on_classification_level(self, classification_scheme: Node,
-                                              level_of_classification: LevelOfClassification):
+    @instrumented('LabelPreprocessor.encode_multi_hot_labels')
+    def encode_multi_hot_labels(self, df: pd.DataFrame, first_column_name: str, second_column_name: str,
+                                number_of_classes: int, value_unrelated=0, use_sparse_matrix=False):
+        """
+        Column-wise counterpart to transform_df_multi_label which directly returns the multi labels as multi-hot
+        matrix, as sklearn.MultiLabelBinarizer(classes=range(number_of_classes)).fit_transform() would do on the
+        column generated by transform_df_multi_label. Both columns must already contain integer labels.
+        :param df: The pandas.DataFrame which provides the integer labels.
+        :param first_column_name: Extract labels from the first column and combine them to multi label.
+        :param second_column_name: Extract labels from the second column and combine them to multi label.
+        :param number_of_classes: Number of columns in the matrix, i.e. the highest integer label + 1.
+        :param value_unrelated: Index of class 'unrelated' so that this is not included in the multi label if it is only
+                present in the second column (do not override first column).
+        :param use_sparse_matrix: If set to true, a scipy.sparse.csr_matrix will be returned instead of a numpy.ndarray.
+        :return: Matrix with one row per row in 'df' and one column per class. Each entry is 1 if the class is part of
+                    the multi label of the row, 0 otherwise.
+        """
+        first_labels = df[first_column_name].to_numpy(dtype=np.int64)
+        second_labels = df[second_column_name].to_numpy(dtype=np.int64)
+        use_second_label = self.__select_second_labels(first_labels, second_labels, value_unrelated)
+        row_indices = np.arange(len(df))
+        rows = np.concatenate([row_indices, row_indices[use_second_label]])
+        columns = np.concatenate([first_labels, second_labels[use_second_label]])
+        if use_sparse_matrix:
+            values = np.ones(len(rows), dtype=np.uint8)
+            return sparse.csr_matrix((values, (rows, columns)), shape=(len(df), number_of_classes))
+        multi_hot = np.zeros((len(df), number_of_classes), dtype=np.uint8)
+        multi_hot[rows, columns] = 1
+        return multi_hot
+
+    def __select_second_labels(self, first_labels: np.ndarray, second_labels: np.ndarray, value_unrelated):
         """
-        Search for representation of the classes given in 'level_of_classification' in the 'classification_scheme'.
-        This transfers the string to a node representation.
-        :param classification_scheme: Root node of hierarchical scheme.
-        :param level_of_classification: Selection of enumeration LevelOfClassification representing the names of the
-                selected classes.
-        :return: A list of nodes taken from the classification scheme. Each node is the representation of one of the
-                 classes mentioned in 'level_of_classification'.
-        """
-        class_names = level_of_classification.value
-        nodes = []
-        for selected_class in class_names:
-            node_for_selected_class = find_by_attr(classification_scheme, selected_class)
-            nodes.append(node_for_selected_class)
-        return nodes
-
-    def __adjust_label(self, classification_scheme: Node, level_of_classification: LevelOfClassification,
-                       label: str, label_unrelated: str):
-        """
-        Returns the label itself if it is one of the classes on the selected 'level_of_classification' or a label for a
-        class which is above in hierarchy and given in 'level_of_classification'. If none fits, it
-        returns 'label_unrelated'.
-        :param classification_scheme: Root node of hierarchical scheme.
-        :param level_of_classification: Selection of enumeration LevelOfClassification representing the names of the
-                selected classes.
-        :param label: Original label.
-        :param label_unrelated: Label which should be used if none from the scheme fits.
-        :return: Adjusted label which either fits the class or its parent class or the 'label_unrelated'.
+        Decides for each row whether the label in the second column is part of the multi label. This is the case if it
+        is neither 'value_unrelated' nor equal to the label in the first column.
+        :param first_labels: Labels from the first column.
+        :param second_labels: Labels from the second column.
+        :param value_unrelated: Label of class 'unrelated'.
+        :return: Boolean numpy.ndarray with one entry per row.
         """
-        nodes = self.__get_classes_on_classification_level(classification_scheme, level_of_classification)
-        for node in nodes:
-            if label == node.name or label in self.__get_list_of_children_in_scheme(node):
-                return node.name
-        return label_unrelated
+        return np.asarray((second_labels != value_unrelated) & (second_labels != first_labels), dtype=bool)
 
-    def __get_list_of_children_in_scheme(self, root_node: Node):
+    def __fingerprint_scheme(self, classification_scheme):
         """
-        Search method for schemes using library anytree. It returns a list of all children for the given root node.
-        :param root_node: Starting point for traversal (anytree.Node).
-        :return: List of children (list of anytree.Node).
+        Describes the structure of a classification scheme, which identifies it in the cache of label indices.
+        :param classification_scheme: Root node of hierarchical scheme or its CompiledClassificationScheme.
+        :return: Tuple with the name and depth of every class in pre-order.
         """
-        result = []
-        queue = []
-        for child in root_node.children:
-            queue.append(child)
-        while queue:
-            current = queue[0]
-            result.append(current.name)
-            for child in current.children:
-                queue.append(child)
-            queue.pop(0)
-        return result
+        if isinstance(classification_scheme, CompiledClassificationScheme):
+            return tuple(zip(classification_scheme.names, classification_scheme.depths.tolist()))
+        return tuple((node.name, node.depth - classification_scheme.depth)
+                     for node in PreOrderIter(classification_scheme))
+
+    def __compile_label_index(self, classification_scheme, level_of_classification: LevelOfClassification):
+        """
+        Builds the mapping from labels to classes on the selected 'level_of_classification'. A label is mapped to the
+        first selected class which either is the label itself or one of its parent classes, so the classes are
+        visited in the order given in 'level_of_classification'.
+        :param classification_scheme: Root node of hierarchical scheme or its CompiledClassificationScheme.
+        :param level_of_classification: Selection of enumeration LevelOfClassification representing the names of the
+                selected classes.
+        :return: Dictionary which maps a label to the name of its class on the selected level.
+        """
+        instrumentation.count('label_index_compilation')
+        if not isinstance(classification_scheme, CompiledClassificationScheme):
+            instrumentation.count('scheme_traversal')
+            classification_scheme = CompiledClassificationScheme(classification_scheme)
+        label_index = dict()
+        for selected_class in level_of_classification.value:
+            class_id = classification_scheme.get_id(selected_class)
+            for descendant_id in classification_scheme.get_descendants(class_id):
+                label_index.setdefault(classification_scheme.names[descendant_id], selected_class)
+        return label_index
+
+    def __resolve_labels(self, labels: pd.Series, label_index: dict, label_unrelated: str):
+        """
+        Looks up every label of the column in the 'label_index'. Each distinct label is only resolved once and the
+        result is broadcast to all rows holding that label.
+        :param labels: Column with the original labels.
+        :param label_index: Mapping from labels to the classes on the selected level.
+        :param label_unrelated: Label for all items which are not contained in 'label_index'.
+        :return: numpy.ndarray with the resolved label for each row of 'labels'.
+        """
+        codes, uniques = pd.factorize(labels)
+        # Missing values get the code -1, which selects 'label_unrelated' appended as the last element.
+        resolved = [label_index.get(label, label_unrelated) for label in uniques]
+        resolved.append(label_unrelated)
+        return np.array(resolved, dtype=object)[codes]
 
 
 class ResultPresenter:
@@ -292,15 +547,11 @@ class ResultPresenter:
     def calculate_average_over_matrix(self, matrix, decimal_places=4):
         """
         Calculate und return the average over all values in the 2D matrix.
-        :param matrix: Scoring matrix.
+        :param matrix: Scoring matrix (list of lists or numpy.ndarray).
         :param decimal_places: Number of digits behind comma (function performs round operation).
         :return: Average over all values in the matrix.
         """
-        average = 0
-        for row in matrix:
-            for item in row:
-                average += item
-        average /= len(matrix) * len(matrix[0])
+        average = float(np.mean(np.asarray(matrix, dtype=float)))
         average = round(average, decimal_places)
         return average
 
@@ -312,18 +563,15 @@ class ResultPresenter:
         :param table_name: Option to give the returned table a name, which will be written in upper-left field.
         :param classifiers: List of all evaluated classifiers.
         :param vectorizers: List of all evaluated vectorizers.
-        :param scores: Scoring matrix (2D).
+        :param scores: Scoring matrix (2D list of lists or numpy.ndarray).
         :param decimal_places: Number of digits behind comma (function performs round operation).
         :return: A prettytable.PrettyTable which can be used to print the results in a good looking way.
         """
-        scores_rounded = scores.copy()
-        for i in range(0, len(classifiers)):
-            for j in range(0, len(vectorizers)):
-                scores_rounded[i][j] = round(scores_rounded[i][j], 4)
+        scores_rounded = [[round(float(scores[i][j]), decimal_places) for j in range(0, len(vectorizers))]
+                          for i in range(0, len(classifiers))]
 
         result_table = PrettyTable()
-        column_names = [type(vectorizers[j]).__name__ + " " + str(vectorizers[j].ngram_range) for j in
-                        range(0, len(vectorizers))]
+        column_names = [self.__get_vectorizer_name(vectorizers[j]) for j in range(0, len(vectorizers))]
         column_names.insert(0, table_name)
 
         result_table.field_names = column_names
@@ -333,3 +581,15 @@ class ResultPresenter:
             result_table.add_row(row_value)
 
         return result_table
+
+    def __get_vectorizer_name(self, vectorizer):
+        """
+        Name of a vectorizer for the column names: its type and n-gram range or, for vectorizers without n-grams
+        (e.g. embedding_cache.EmbeddingVectorizer), its model name if it has one.
+        :param vectorizer: Evaluated vectorizer.
+        :return: Name of the vectorizer.
+        """
+        for attribute in ('ngram_range', 'model_name'):
+            if hasattr(vectorizer, attribute):
+                return type(vectorizer).__name__ + " " + str(getattr(vectorizer, attribute))
+        return type(vectorizer).__name__
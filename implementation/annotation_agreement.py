@@ -0,0 +1,316 @@
+import argparse
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, repeat
+import numpy as np
+from prettytable import PrettyTable
+from classification_scheme import ClassificationSchemeBuilder
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification
+
+
+class AnnotationAgreement:
+    """
+    AnnotationAgreement computes the inter-annotator agreement on the labels in the annotation folder, in which every
+    annotator has a folder (e.g. 'annotator1') with one csv file per document. The rows of the annotators are aligned
+    by their 'sentence_number'. For every document annotated by at least two annotators and every level of
+    classification, the labels are rolled up with the classification scheme (see LabelPreprocessor) and Cohen's kappa
+    (for every pair of annotators), Fleiss' kappa and Krippendorff's alpha (nominal) are computed. The documents are
+    processed in parallel.
+    Labels are lowercased and the spellings in LABEL_ALIASES are replaced. On level LEVEL_0, the 'design_decision'
+    column is used where it is filled, as labels of earlier versions of the taxonomy without a counterpart in the
+    scheme (e.g. 'method' or 'library') are design decisions nevertheless. On all other levels, these labels are
+    unrelated.
+    """
+    LABEL_ALIASES = {'architecture style': 'architectural style', 'database': 'data base',
+                     'interface definition': 'interface', 'interface defintion': 'interface',
+                     'relationship': 'relation', 'technology': 'technological'}
+    NO_LABEL = '-'
+
+    def __init__(self, annotation_folder: str, label_unrelated='none of these', column_name='classification',
+                 encoding='utf-8'):
+        """
+        Create the agreement computation for an annotation folder.
+        :param annotation_folder: Folder which contains one folder per annotator, whose name starts with 'annotator'.
+        :param label_unrelated: Label for all items that do not fit any class on a level of classification.
+        :param column_name: Column of the csv files with the labels.
+        :param encoding: Encoding of the csv files.
+        """
+        self.annotation_folder = annotation_folder
+        self.label_unrelated = label_unrelated
+        self.column_name = column_name
+        self.encoding = encoding
+
+    def find_documents(self):
+        """
+        Find the csv files of all documents which were annotated by at least two annotators. Document names are
+        compared ignoring the case, e.g. 'Zengarden.csv' and 'ZenGarden.csv' belong to the same document.
+        :return: List of tuples (document name, dictionary which maps the annotator to the csv file), ordered by name.
+        """
+        documents = dict()
+        for annotator_folder in sorted(glob.glob(os.path.join(self.annotation_folder, 'annotator*'))):
+            annotator = os.path.basename(annotator_folder)
+            for csv_file in sorted(glob.glob(os.path.join(annotator_folder, '*.csv'))):
+                document_name = os.path.splitext(os.path.basename(csv_file))[0]
+                documents.setdefault(document_name.lower(), (document_name, dict()))[1][annotator] = csv_file
+        return [documents[key] for key in sorted(documents) if len(documents[key][1]) >= 2]
+
+    def compute_agreement(self, levels_of_classification=tuple(LevelOfClassification), n_jobs=1):
+        """
+        Compute the agreement for every document and level of classification as well as over all documents.
+        :param levels_of_classification: Levels of classification the labels are rolled up to.
+        :param n_jobs: Number of worker processes, -1 uses all available CPUs.
+        :return: List of dictionaries with 'document' ('all documents' for the pooled agreement over all documents
+                 with the same annotators), 'level', 'annotators', 'units' (sentences rated by all annotators),
+                 'percent_agreement', 'cohen_kappa' (dictionary which maps 'annotator a/annotator b' to the kappa),
+                 'fleiss_kappa' and 'krippendorff_alpha'. Undefined measures are None.
+        """
+        documents = self.find_documents()
+        levels_of_classification = list(levels_of_classification)
+        if n_jobs == 1:
+            document_results = list(map(self.align_document, documents,
+                                        repeat(levels_of_classification)))
+        else:
+            with ProcessPoolExecutor(max_workers=None if n_jobs == -1 else n_jobs) as executor:
+                document_results = list(executor.map(self.align_document, documents,
+                                                     repeat(levels_of_classification)))
+
+        results = []
+        pooled_ratings = dict()
+        for document_name, annotators, level_ratings in document_results:
+            for level_of_classification in levels_of_classification:
+                ratings = level_ratings[level_of_classification.name]
+                results.append(self.__describe_agreement(document_name, level_of_classification, annotators,
+                                                         ratings))
+                pooled_ratings.setdefault((tuple(annotators), level_of_classification), []).append(ratings)
+        for (annotators, level_of_classification), ratings in pooled_ratings.items():
+            results.append(self.__describe_agreement('all documents', level_of_classification, list(annotators),
+                                                     np.concatenate(ratings)))
+        return results
+
+    def present_agreement_in_table(self, results: list, decimal_places=3):
+        """
+        Present the agreement in a table.
+        :param results: Results of compute_agreement().
+        :param decimal_places: Number of digits behind comma.
+        :return: prettytable.PrettyTable
+        """
+        table = PrettyTable()
+        table.field_names = ['Document', 'Level', 'Units', 'Agreement', "Cohen's kappa", "Fleiss' kappa",
+                             "Krippendorff's alpha"]
+
+        def format_value(value):
+            return '-' if value is None else round(value, decimal_places)
+        for result in results:
+            cohen_kappa = ', '.join(pair + ': ' + str(format_value(kappa))
+                                    for pair, kappa in result['cohen_kappa'].items())
+            table.add_row([result['document'], result['level'], result['units'],
+                           format_value(result['percent_agreement']), cohen_kappa,
+                           format_value(result['fleiss_kappa']), format_value(result['krippendorff_alpha'])])
+        return table
+
+    def align_document(self, document: tuple, levels_of_classification: list):
+        """
+        Read and align the labels of a document and roll them up to every level of classification. compute_agreement()
+        runs this in the worker processes.
+        :param document: Tuple (document name, dictionary which maps the annotator to the csv file), see
+                find_documents().
+        :param levels_of_classification: Levels of classification the labels are rolled up to.
+        :return: Tuple (document name, list of annotators, dictionary which maps the name of each level to a
+                 numpy.ndarray of labels with one row per sentence and one column per annotator, None if missing).
+        """
+        document_name, csv_files = document
+        annotators = sorted(csv_files)
+        labels_by_annotator, design_decisions_by_annotator = zip(*[self.__read_labels(csv_files[annotator])
+                                                                    for annotator in annotators])
+        sentence_numbers = sorted(set().union(*labels_by_annotator))
+        ratings = np.array([[labels.get(sentence_number) for labels in labels_by_annotator]
+                            for sentence_number in sentence_numbers], dtype=object).reshape(-1, len(annotators))
+        design_decisions = np.array([[design_decisions.get(sentence_number)
+                                      for design_decisions in design_decisions_by_annotator]
+                                     for sentence_number in sentence_numbers], dtype=object).reshape(ratings.shape)
+
+        label_preprocessor = LabelPreprocessor()
+        classification_scheme = ClassificationSchemeBuilder().build_compiled_classification_scheme()
+        level_ratings = dict()
+        for level_of_classification in levels_of_classification:
+            label_index = label_preprocessor.get_label_index(classification_scheme, level_of_classification,
+                                                             self.label_unrelated)
+            level_ratings[level_of_classification.name] = np.array(
+                [[None if label is None else label_index.get(label, self.label_unrelated) for label in row]
+                 for row in ratings], dtype=object).reshape(ratings.shape)
+            if level_of_classification == LevelOfClassification.LEVEL_0:
+                filled = np.not_equal(design_decisions, None) & np.not_equal(ratings, None)
+                level_ratings[level_of_classification.name][filled] = [
+                    level_of_classification.value[0] if design_decision else self.label_unrelated
+                    for design_decision in design_decisions[filled]]
+        return document_name, annotators, level_ratings
+
+    def __read_labels(self, csv_file: str):
+        """
+        Stream the labels of one annotator from a csv file. The separator (';' or ',') is detected from the header.
+        :param csv_file: Path to the csv file.
+        :return: Tuple (dictionary which maps the sentence number to the normalized label, dictionary which maps the
+                 sentence number to whether it is a design decision for all sentences with a filled 'design_decision'
+                 column).
+        """
+        labels = dict()
+        design_decisions = dict()
+        with open(csv_file, 'r', encoding=self.encoding, newline='') as file:
+            header = file.readline()
+            file.seek(0)
+            delimiter = ';' if header.count(';') > header.count(',') else ','
+            for row in csv.DictReader(file, delimiter=delimiter):
+                sentence_number = (row.get('sentence_number') or '').strip()
+                if sentence_number:
+                    labels[int(sentence_number)] = self.__normalize_label(row.get(self.column_name))
+                    design_decision = (row.get('design_decision') or '').strip()
+                    if design_decision:
+                        design_decisions[int(sentence_number)] = int(design_decision) != 0
+        return labels, design_decisions
+
+    def __normalize_label(self, label):
+        """
+        Normalize the spelling of a label.
+        :param label: Label from the csv file or None.
+        :return: Lowercased label with replaced aliases, NO_LABEL for empty labels.
+        """
+        label = (label or '').strip().lower()
+        if label == '':
+            return self.NO_LABEL
+        return self.LABEL_ALIASES.get(label, label)
+
+    def __describe_agreement(self, document_name: str, level_of_classification: LevelOfClassification,
+                             annotators: list, ratings: np.ndarray):
+        """
+        Compute all agreement measures for the ratings of a document on a level of classification.
+        :param document_name: Name of the document.
+        :param level_of_classification: Level of classification of the ratings.
+        :param annotators: Names of the annotators, one per column of 'ratings'.
+        :param ratings: numpy.ndarray of labels with one row per sentence and one column per annotator.
+        :return: Dictionary with the results, see compute_agreement().
+        """
+        codes = encode_ratings(ratings)
+        complete = (codes >= 0).all(axis=1)
+        percent_agreement = (codes[complete] == codes[complete, :1]).all(axis=1).mean() if complete.any() else np.nan
+        result = {'document': document_name, 'level': level_of_classification.name, 'annotators': annotators,
+                  'units': int(complete.sum()), 'percent_agreement': percent_agreement,
+                  'cohen_kappa': {annotators[a] + '/' + annotators[b]: cohen_kappa(codes[:, a], codes[:, b])
+                                  for a, b in combinations(range(len(annotators)), 2)},
+                  'fleiss_kappa': fleiss_kappa(codes), 'krippendorff_alpha': krippendorff_alpha(codes)}
+        # Undefined measures are None, so that the results can be written as JSON.
+        result['cohen_kappa'] = {pair: None if np.isnan(kappa) else kappa
+                                 for pair, kappa in result['cohen_kappa'].items()}
+        for measure in ('percent_agreement', 'fleiss_kappa', 'krippendorff_alpha'):
+            result[measure] = None if np.isnan(result[measure]) else float(result[measure])
+        return result
+
+
+def encode_ratings(ratings: np.ndarray):
+    """
+    Replace the labels of a rating matrix by integer codes.
+    :param ratings: numpy.ndarray of labels with one row per unit and one column per rater, None if missing.
+    :return: numpy.ndarray of the same shape with codes from 0 to the number of distinct labels - 1, -1 if missing.
+    """
+    ratings = np.asarray(ratings, dtype=object)
+    missing = np.array([[label is None for label in row] for row in ratings], dtype=bool).reshape(ratings.shape)
+    codes = np.full(ratings.shape, -1, dtype=np.int64)
+    if (~missing).any():
+        _, codes[~missing] = np.unique(ratings[~missing].astype(str), return_inverse=True)
+    return codes
+
+
+def cohen_kappa(codes_a: np.ndarray, codes_b: np.ndarray):
+    """
+    Compute Cohen's kappa of two raters over all units rated by both.
+    :param codes_a: Integer codes of the first rater, -1 if missing.
+    :param codes_b: Integer codes of the second rater, -1 if missing.
+    :return: Kappa or nan if it is undefined (e.g. both raters always chose the same single label).
+    """
+    rated = (codes_a >= 0) & (codes_b >= 0)
+    if not rated.any():
+        return float('nan')
+    number_of_categories = int(max(codes_a.max(), codes_b.max())) + 1
+    confusion_matrix = np.zeros((number_of_categories, number_of_categories))
+    np.add.at(confusion_matrix, (codes_a[rated], codes_b[rated]), 1)
+    confusion_matrix /= confusion_matrix.sum()
+    observed_agreement = np.trace(confusion_matrix)
+    expected_agreement = confusion_matrix.sum(axis=1) @ confusion_matrix.sum(axis=0)
+    if np.isclose(expected_agreement, 1):
+        return float('nan')
+    return float((observed_agreement - expected_agreement) / (1 - expected_agreement))
+
+
+def fleiss_kappa(codes: np.ndarray):
+    """
+    Compute Fleiss' kappa over all units which were rated by all raters.
+    :param codes: Integer codes with one row per unit and one column per rater, -1 if missing.
+    :return: Kappa or nan if it is undefined.
+    """
+    codes = codes[(codes >= 0).all(axis=1)]
+    number_of_units, number_of_raters = codes.shape
+    if number_of_units == 0 or number_of_raters < 2:
+        return float('nan')
+    counts = np.zeros((number_of_units, int(codes.max()) + 1))
+    np.add.at(counts, (np.repeat(np.arange(number_of_units), number_of_raters), codes.ravel()), 1)
+    unit_agreement = ((counts ** 2).sum(axis=1) - number_of_raters) / (number_of_raters * (number_of_raters - 1))
+    category_proportions = counts.sum(axis=0) / (number_of_units * number_of_raters)
+    expected_agreement = (category_proportions ** 2).sum()
+    if np.isclose(expected_agreement, 1):
+        return float('nan')
+    return float((unit_agreement.mean() - expected_agreement) / (1 - expected_agreement))
+
+
+def krippendorff_alpha(codes: np.ndarray):
+    """
+    Compute Krippendorff's alpha for nominal data from the coincidence matrix. Units with missing ratings are used as
+    long as they were rated at least twice.
+    :param codes: Integer codes with one row per unit and one column per rater, -1 if missing.
+    :return: Alpha or nan if it is undefined.
+    """
+    pairable = (codes >= 0).sum(axis=1) >= 2
+    codes = codes[pairable]
+    if len(codes) == 0:
+        return float('nan')
+    rows, columns = np.nonzero(codes >= 0)
+    counts = np.zeros((len(codes), int(codes.max()) + 1))
+    np.add.at(counts, (rows, codes[rows, columns]), 1)
+    weights = 1 / (counts.sum(axis=1) - 1)
+    coincidence_matrix = (counts * weights[:, None]).T @ counts - np.diag(weights @ counts)
+    category_totals = coincidence_matrix.sum(axis=1)
+    total = category_totals.sum()
+    expected_disagreement = total ** 2 - (category_totals ** 2).sum()
+    if expected_disagreement == 0:
+        return float('nan')
+    return float(1 - (total - 1) * (total - np.trace(coincidence_matrix)) / expected_disagreement)
+
+
+def main(arguments=None):
+    """
+    Command line interface, e.g. 'python annotation_agreement.py --output agreement.json'.
+    :param arguments: List of command line arguments, sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(description='Compute the inter-annotator agreement of the annotations.')
+    parser.add_argument('--annotation-folder', default=os.path.join(os.path.dirname(__file__), '..', 'annotation'),
+                        help='folder with one folder per annotator')
+    parser.add_argument('--levels', nargs='+', choices=[level.name for level in LevelOfClassification],
+                        default=[level.name for level in LevelOfClassification])
+    parser.add_argument('--column', default='classification', help='column of the csv files with the labels')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='number of worker processes')
+    parser.add_argument('--output', help='file for the results in JSON, a table is printed if not given')
+    arguments = parser.parse_args(arguments)
+
+    annotation_agreement = AnnotationAgreement(arguments.annotation_folder, column_name=arguments.column)
+    results = annotation_agreement.compute_agreement([LevelOfClassification[level] for level in arguments.levels],
+                                                     n_jobs=arguments.n_jobs)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(annotation_agreement.present_agreement_in_table(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import nltk
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics import make_scorer, accuracy_score, f1_score
+from sklearn.model_selection import KFold
+from sklearn.naive_bayes import MultinomialNB
+from classification_scheme import ClassificationSchemeBuilder
+from corpus_loader import CorpusLoader
+from evaluation_engine import EvaluationEngine
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification, TextPreprocessor
+
+PREPROCESSING_FLAGS = ['do_cleanup', 'do_lowercasing', 'do_stop_word_removal', 'do_lemmatization']
+
+
+class Benchmark:
+    """
+    Benchmark measures the stages of the classification process (loading, text preprocessing, label preprocessing and
+    cross-validation) on a corpus and on synthetic corpora in which every line of the corpus is replicated. For every
+    stage, the median runtime over several repetitions, the throughput in lines per second and the peak memory
+    allocated by Python (measured with tracemalloc in an additional run) are recorded. Text preprocessing
+    configurations whose NLTK resources are not installed are recorded with an error instead.
+    """
+    def __init__(self, root_folder: str, repetitions=3, label_unrelated='none of these'):
+        """
+        Create a benchmark for the corpus in 'root_folder'.
+        :param root_folder: Folder with the corpus (txt and csv files).
+        :param repetitions: Number of timed runs per stage.
+        :param label_unrelated: Label for all items that do not fit any class on the selected level.
+        """
+        self.root_folder = root_folder
+        self.repetitions = repetitions
+        self.label_unrelated = label_unrelated
+        self.corpus_loader = CorpusLoader()
+        self.classification_scheme = ClassificationSchemeBuilder().build_classification_scheme()
+        self.results = []
+
+    def run(self, scales, preprocessing_combinations, text_preprocessor: TextPreprocessor):
+        """
+        Run all stages for every scale.
+        :param scales: Iterable of replication factors, 1 is the corpus itself.
+        :param preprocessing_combinations: Iterable of dictionaries with values for the flags in PREPROCESSING_FLAGS.
+        :param text_preprocessor: Preprocessor used for the text preprocessing stage.
+        :return: List of the results, one dictionary per stage and scale.
+        """
+        for scale in scales:
+            with tempfile.TemporaryDirectory() as corpus_folder:
+                self.__write_scaled_corpus(corpus_folder, scale)
+                corpus = self.measure('load', scale, {}, None,
+                                      lambda: self.corpus_loader.generate_data_frame(corpus_folder))
+            lines = len(corpus)
+            self.results[-1]['lines'] = lines
+            self.results[-1]['lines_per_second'] = self.__throughput(lines, self.results[-1]['seconds'])
+
+            for flags in preprocessing_combinations:
+                try:
+                    self.measure('preprocess', scale, flags, lines,
+                                 lambda: text_preprocessor.preprocess_batch(corpus['line'], **flags))
+                except LookupError as error:
+                    # NLTK resources for this configuration are not installed
+                    self.results.append({'stage': 'preprocess', 'scale': scale, 'parameters': flags, 'lines': lines,
+                                         'error': str(error).strip()})
+
+            unified_corpora = dict()
+            for level_of_classification in LevelOfClassification:
+                parameters = {'level_of_classification': level_of_classification.name}
+                unified_corpora[level_of_classification] = self.measure(
+                    'unify_labels', scale, parameters, lines,
+                    lambda: LabelPreprocessor().transform_df_unified_labels(
+                        corpus, 'classification', self.classification_scheme, level_of_classification,
+                        self.label_unrelated))
+            unified_corpus = unified_corpora[LevelOfClassification.LEAVES]
+
+            label_preprocessor = LabelPreprocessor()
+            dictionary = label_preprocessor.generate_dictionary_for_integer_labels(LevelOfClassification.LEAVES.value,
+                                                                                   self.label_unrelated)
+            self.measure('integer_labels', scale, {'method': 'transform_df_integer_labels'}, lines,
+                         lambda: label_preprocessor.transform_df_integer_labels(unified_corpus, 'classification',
+                                                                                dictionary))
+            labels = self.measure('integer_labels', scale, {'method': 'encode_integer_labels'}, lines,
+                                  lambda: label_preprocessor.encode_integer_labels(unified_corpus, 'classification',
+                                                                                   dictionary))
+
+            scoring = {'accuracy': make_scorer(accuracy_score),
+                       'f1_score': make_scorer(f1_score, average='weighted', zero_division=0)}
+            engine = EvaluationEngine([MultinomialNB()], [CountVectorizer()], scoring, KFold(n_splits=5), n_jobs=1)
+            self.measure('cross_validation_cell', scale,
+                         {'classifier': 'MultinomialNB', 'vectorizer': 'CountVectorizer', 'folds': 5}, lines,
+                         lambda: engine.evaluate(corpus['line'], labels))
+        return self.results
+
+    def measure(self, stage: str, scale: int, parameters: dict, lines, function):
+        """
+        Measure the runtime and peak memory of 'function' and append the result.
+        :param stage: Name of the stage.
+        :param scale: Replication factor of the corpus.
+        :param parameters: Configuration of the stage, written to the result.
+        :param lines: Number of lines processed by the stage or None if not known yet.
+        :param function: Function without parameters which runs the stage.
+        :return: Return value of the last call of 'function'.
+        """
+        runtimes = []
+        for _ in range(self.repetitions):
+            start = time.perf_counter()
+            return_value = function()
+            runtimes.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            function()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        seconds = statistics.median(runtimes)
+        self.results.append({'stage': stage, 'scale': scale, 'parameters': parameters, 'lines': lines,
+                             'seconds': seconds, 'seconds_per_repetition': runtimes,
+                             'lines_per_second': self.__throughput(lines, seconds),
+                             'peak_memory_bytes': peak_memory})
+        return return_value
+
+    def __throughput(self, lines, seconds: float):
+        """
+        Compute the throughput of a stage.
+        :param lines: Number of processed lines or None.
+        :param seconds: Runtime of the stage.
+        :return: Lines per second or None if it cannot be computed.
+        """
+        if lines is None or seconds <= 0:
+            return None
+        return lines / seconds
+
+    def __write_scaled_corpus(self, corpus_folder: str, scale: int):
+        """
+        Write a copy of the corpus to 'corpus_folder' in which every document consists of 'scale' copies of the
+        original document.
+        :param corpus_folder: Target folder.
+        :param scale: Replication factor.
+        """
+        for document_name, txt_file, csv_file in self.corpus_loader.find_documents(self.root_folder):
+            with open(txt_file, 'r', encoding=self.corpus_loader.encoding) as file:
+                lines = [line.replace('\n', '') for line in file]
+            classifications = pd.read_csv(csv_file, sep=self.corpus_loader.csv_separator)
+            with open(os.path.join(corpus_folder, document_name + '.txt'), 'w',
+                      encoding=self.corpus_loader.encoding) as file:
+                file.write('\n'.join(lines * scale) + '\n')
+            pd.concat([classifications] * scale, ignore_index=True).to_csv(
+                os.path.join(corpus_folder, document_name + '.csv'), sep=self.corpus_loader.csv_separator,
+                index=False)
+
+
+def describe_environment():
+    """
+    Collect the versions of Python and the libraries which influence the results.
+    :return: Dictionary with the description of the environment.
+    """
+    return {'python': sys.version, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'sklearn': sklearn.__version__,
+            'nltk': nltk.__version__}
+
+
+def compare_results(results: list, baseline_results: list):
+    """
+    Compare the runtimes of two benchmark runs stage by stage.
+    :param results: Results of the current run.
+    :param baseline_results: Results of the run to compare with.
+    :return: List of tuples (stage, scale, parameters, baseline seconds, seconds, ratio) for all stages which were
+             measured in both runs.
+    """
+    baseline = {(r['stage'], r['scale'], json.dumps(r['parameters'], sort_keys=True)): r
+                for r in baseline_results if 'seconds' in r}
+    comparison = []
+    for result in results:
+        key = (result['stage'], result['scale'], json.dumps(result['parameters'], sort_keys=True))
+        if key in baseline and 'seconds' in result:
+            baseline_seconds = baseline[key]['seconds']
+            ratio = result['seconds'] / baseline_seconds if baseline_seconds > 0 else None
+            comparison.append((result['stage'], result['scale'], result['parameters'], baseline_seconds,
+                               result['seconds'], ratio))
+    return comparison
+
+
+def main(arguments=None):
+    """
+    Command line interface of the benchmark, e.g. 'python benchmark.py --scales 1 10 100 --output results.json'.
+    :param arguments: List of command line arguments, sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the stages of the classification of design decisions.')
+    parser.add_argument('--root-folder', default=os.path.join(os.path.dirname(__file__), '..', 'dataset'),
+                        help='folder with the corpus (txt and csv files)')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10],
+                        help='replication factors for the synthetic corpora, 1 is the corpus itself')
+    parser.add_argument('--repetitions', type=int, default=3, help='number of timed runs per stage')
+    parser.add_argument('--preprocessing', choices=['default', 'all'], default='default',
+                        help="'default' measures the configuration of the notebook, 'all' every combination of flags")
+    parser.add_argument('--download-resources', action='store_true', help='download the NLTK resources first')
+    parser.add_argument('--output', help='file for the results in JSON, printed to stdout if not given')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare the runtimes with')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.preprocessing == 'all':
+        preprocessing_combinations = [dict(zip(PREPROCESSING_FLAGS, values))
+                                      for values in itertools.product([False, True], repeat=len(PREPROCESSING_FLAGS))]
+    else:
+        preprocessing_combinations = [dict(do_cleanup=False, do_lowercasing=True, do_stop_word_removal=False,
+                                           do_lemmatization=True)]
+
+    text_preprocessor = TextPreprocessor(download_resources=arguments.download_resources)
+    benchmark = Benchmark(arguments.root_folder, repetitions=arguments.repetitions)
+    results = benchmark.run(arguments.scales, preprocessing_combinations, text_preprocessor)
+    report = {'environment': describe_environment(), 'repetitions': arguments.repetitions, 'results': results}
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if arguments.compare:
+        with open(arguments.compare, 'r') as file:
+            baseline_results = json.load(file)['results']
+        for stage, scale, parameters, baseline_seconds, seconds, ratio in compare_results(results, baseline_results):
+            ratio_text = 'n/a' if ratio is None else '{:.2f}x'.format(ratio)
+            print('{} (scale {}, {}): {:.4f}s -> {:.4f}s ({})'.format(stage, scale, parameters, baseline_seconds,
+                                                                      seconds, ratio_text), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from enum import Enum
+from functools import lru_cache
+from types import MappingProxyType
 from anytree import Node, RenderTree, find_by_attr
+import numpy as np
 
 
 class ClassificationSchemeBuilder:
@@ -67,3 +70,133 @@ class ClassificationSchemeBuilder:
         classification_scheme = design_decision
         return classification_scheme
 
+    def build_compiled_classification_scheme(self):
+        """
+        Returns the taxonomy as CompiledClassificationScheme. It is compiled only once and shared by all callers, as it
+        is immutable.
+        :return: compiled classification scheme
+        """
+        return _compile_classification_scheme()
+
+
+class CompiledClassificationScheme:
+    """
+    Immutable, array-based representation of a classification scheme. Every class gets an integer id, which is its
+    position in pre-order, so the descendants of a class have the ids from its own id up to (excluding) its subtree
+    end. This allows to check in constant time whether a class is a descendant of another class and to look up the
+    ancestor of a class on a specific depth. Use to_tree() to get the anytree representation, e.g. for rendering.
+    """
+    __slots__ = ('names', 'name_to_id', 'parents', 'depths', 'subtree_ends', 'ancestors')
+
+    def __init__(self, classification_scheme: Node):
+        """
+        Compile the tree with the given root node.
+        :param classification_scheme: Root node of the classification scheme.
+        :raises ValueError: if several classes have the same name
+        """
+        names, parents, depths = [], [], []
+        stack = [(classification_scheme, -1)]
+        while stack:
+            node, parent = stack.pop()
+            node_id = len(names)
+            names.append(node.name)
+            parents.append(parent)
+            depths.append(0 if parent < 0 else depths[parent] + 1)
+            stack.extend((child, node_id) for child in reversed(node.children))
+
+        duplicate_names = sorted({name for name in names if names.count(name) > 1})
+        if duplicate_names:
+            raise ValueError("Class names must be unique, found duplicates: " + str(duplicate_names))
+
+        number_of_nodes = len(names)
+        subtree_ends = np.arange(1, number_of_nodes + 1)
+        for node_id in range(number_of_nodes - 1, 0, -1):
+            subtree_ends[parents[node_id]] = max(subtree_ends[parents[node_id]], subtree_ends[node_id])
+
+        ancestors = np.full((number_of_nodes, max(depths) + 1), -1)
+        for node_id in range(number_of_nodes):
+            if parents[node_id] >= 0:
+                ancestors[node_id] = ancestors[parents[node_id]]
+            ancestors[node_id, depths[node_id]] = node_id
+
+        object.__setattr__(self, 'names', tuple(names))
+        object.__setattr__(self, 'name_to_id', MappingProxyType({name: i for i, name in enumerate(names)}))
+        for attribute, values in (('parents', parents), ('depths', depths), ('subtree_ends', subtree_ends),
+                                  ('ancestors', ancestors)):
+            array = np.array(values, dtype=np.int32)
+            array.flags.writeable = False
+            object.__setattr__(self, attribute, array)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("CompiledClassificationScheme is immutable")
+
+    def __reduce__(self):
+        """
+        The compiled scheme is pickled (and copied) as its tree and compiled again when it is loaded.
+        :return: tuple (class, arguments of the constructor)
+        """
+        return CompiledClassificationScheme, (self.to_tree(),)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_id(self, name: str):
+        """
+        Returns the id of the class with the given name.
+        :param name: name of the class
+        :return: id of the class
+        :raises KeyError: if there is no class with this name in the scheme
+        """
+        return self.name_to_id[name]
+
+    def is_descendant(self, node_id: int, ancestor_id: int, include_self=True):
+        """
+        Checks in constant time whether the class 'node_id' is a descendant of the class 'ancestor_id'.
+        :param node_id: id of the possible descendant
+        :param ancestor_id: id of the possible ancestor
+        :param include_self: if set to true, every class is considered a descendant of itself
+        :return: True if 'node_id' is in the subtree of 'ancestor_id'
+        """
+        if node_id == ancestor_id:
+            return include_self
+        return ancestor_id < node_id < self.subtree_ends[ancestor_id]
+
+    def get_descendants(self, node_id: int, include_self=True):
+        """
+        Returns the ids of all descendants of a class in pre-order.
+        :param node_id: id of the class
+        :param include_self: if set to true, the class itself is the first element
+        :return: range of ids
+        """
+        return range(node_id if include_self else node_id + 1, int(self.subtree_ends[node_id]))
+
+    def get_ancestor_at_depth(self, node_id: int, depth: int):
+        """
+        Returns in constant time the ancestor of a class on the given depth (the root has depth 0).
+        :param node_id: id of the class
+        :param depth: depth of the ancestor
+        :return: id of the ancestor or -1 if the class is on a lower depth than 'depth'
+        """
+        if depth >= self.ancestors.shape[1]:
+            return -1
+        return int(self.ancestors[node_id, depth])
+
+    def to_tree(self):
+        """
+        Converts the compiled scheme back to a tree of anytree.Node objects.
+        :return: root node of the classification scheme
+        """
+        nodes = []
+        for node_id, name in enumerate(self.names):
+            parent = self.parents[node_id]
+            nodes.append(Node(name, parent=nodes[parent] if parent >= 0 else None))
+        return nodes[0]
+
+
+@lru_cache(maxsize=None)
+def _compile_classification_scheme():
+    """
+    Compiles the taxonomy built by ClassificationSchemeBuilder once per process.
+    :return: compiled classification scheme
+    """
+    return CompiledClassificationScheme(ClassificationSchemeBuilder().build_classification_scheme())
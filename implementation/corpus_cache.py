@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from corpus_loader import CorpusLoader
+from SAD_classification_dataframe_operations import TextPreprocessor
+
+
+class PreprocessedCorpusCache:
+    """
+    PreprocessedCorpusCache stores preprocessed documents of a corpus on disk, so that the text preprocessing only has
+    to be done once per document and configuration. Each document is stored under a key which is computed from the
+    content of its txt and csv file and the preprocessing configuration. Therefore, only documents that changed (or
+    were preprocessed with another configuration) are preprocessed again. The columns of a document are stored as
+    numpy arrays, which are memory-mapped when they are loaded. Missing values of text columns are stored as a separate
+    mask, as numpy string arrays cannot hold them.
+    """
+    FORMAT_VERSION = 3
+    TEMPORARY_FOLDER_MAX_AGE = 3600
+
+    def __init__(self, cache_folder: str, text_preprocessor: TextPreprocessor, corpus_loader=None):
+        """
+        Create a cache which stores its entries in 'cache_folder'. The folder will be created if it does not exist.
+        :param cache_folder: Folder for the cached documents.
+        :param text_preprocessor: Preprocessor which is used for documents that are not cached yet.
+        :param corpus_loader: CorpusLoader which reads documents that are not cached yet, a default one if None.
+        """
+        self.cache_folder = cache_folder
+        self.text_preprocessor = text_preprocessor
+        self.corpus_loader = corpus_loader if corpus_loader is not None else CorpusLoader()
+        self.__used_keys = set()
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def load_preprocessed_corpus(self, root_folder: str, do_cleanup=False, do_lowercasing=False,
+                                 do_stop_word_removal=False, do_lemmatization=False, n_jobs=1,
+                                 document_fingerprints=None):
+        """
+        Generate the preprocessed corpus as pandas.DataFrame from the txt and csv files stored in the root folder.
+        Documents are taken from the cache if possible, all others are preprocessed (together in one batch) and added
+        to the cache. The result has the columns in CorpusLoader.COLUMNS, where 'line' holds the preprocessed line.
+        :param root_folder: Folder with the corpus, each document consists of a txt and a csv file with the same name.
+        :param do_cleanup: if set to true, special characters, digits and hyperlinks will be removed
+        :param do_lowercasing: if set to true, all characters will be lowercased
+        :param do_stop_word_removal: if set to true, stop words from NLKT.corpus.stopwords will be removed
+        :param do_lemmatization: if set to true, words will be reduced to their lemma
+        :param n_jobs: number of processes used to preprocess documents which are not cached
+        :param document_fingerprints: Dictionary which maps the name of a document to its fingerprint (see
+                CorpusLoader.fingerprint_document) if it was already computed, documents without an entry are hashed.
+        :return: pandas.DataFrame with the preprocessed lines and their labels
+        """
+        preprocessing_flags = dict(do_cleanup=do_cleanup, do_lowercasing=do_lowercasing,
+                                   do_stop_word_removal=do_stop_word_removal, do_lemmatization=do_lemmatization)
+        documents = []
+        missing_documents = []
+        document_fingerprints = document_fingerprints or dict()
+        for document_name, txt_file, csv_file in self.corpus_loader.find_documents(root_folder):
+            document_fingerprint = document_fingerprints.get(document_name)
+            if document_fingerprint is None:
+                document_fingerprint = self.corpus_loader.fingerprint_document(txt_file, csv_file)
+            key = self.__compute_key(document_fingerprint, preprocessing_flags)
+            self.__used_keys.add(key)
+            document = self.__load_entry(key)
+            if document is None:
+                document = self.corpus_loader.read_document(document_name, txt_file, csv_file)
+                missing_documents.append((key, document))
+            documents.append(document)
+
+        if missing_documents:
+            raw_lines = [line for _, document in missing_documents for line in document['line']]
+            preprocessed_lines = iter(self.text_preprocessor.preprocess_batch(raw_lines, n_jobs=n_jobs,
+                                                                              **preprocessing_flags))
+            for key, document in missing_documents:
+                document['line'] = [next(preprocessed_lines) for _ in range(len(document))]
+                self.__store_entry(key, document)
+
+        return self.corpus_loader.concatenate_documents(documents)
+
+    def remove_unused_entries(self):
+        """
+        Delete all entries from the cache folder which were not loaded or stored by this cache instance, e.g. entries
+        of documents which changed since. Temporary folders are only deleted if they are older than
+        TEMPORARY_FOLDER_MAX_AGE seconds, as younger ones may belong to entries other processes are storing.
+        :return: Number of deleted entries.
+        """
+        removed_entries = 0
+        for key in os.listdir(self.cache_folder):
+            entry_folder = os.path.join(self.cache_folder, key)
+            if key.startswith('.tmp-') and \
+                    time.time() - os.path.getmtime(entry_folder) < self.TEMPORARY_FOLDER_MAX_AGE:
+                continue
+            if key not in self.__used_keys and os.path.isdir(entry_folder):
+                shutil.rmtree(entry_folder)
+                removed_entries += 1
+        return removed_entries
+
+    def __compute_key(self, document_fingerprint: str, preprocessing_flags: dict):
+        """
+        Compute the key of a document from its content and the preprocessing configuration.
+        :param document_fingerprint: Fingerprint of the txt and csv file, see CorpusLoader.fingerprint_document.
+        :param preprocessing_flags: Configuration of the text preprocessing.
+        :return: Hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps([self.FORMAT_VERSION, preprocessing_flags, document_fingerprint],
+                                 sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __load_entry(self, key: str):
+        """
+        Load a document from the cache.
+        :param key: Key of the document.
+        :return: pandas.DataFrame of the document or None if it is not cached.
+        """
+        entry_folder = os.path.join(self.cache_folder, key)
+        if not os.path.isdir(entry_folder):
+            return None
+        columns = dict()
+        for column in CorpusLoader.COLUMNS:
+            values = np.load(os.path.join(entry_folder, column + '.npy'), mmap_mode='r')
+            mask_file = os.path.join(entry_folder, column + '_missing.npy')
+            if os.path.isfile(mask_file):
+                values = values.astype(object)
+                values[np.load(mask_file)] = np.nan
+            columns[column] = values
+        return pd.DataFrame(columns, columns=CorpusLoader.COLUMNS)
+
+    def __store_entry(self, key: str, document: pd.DataFrame):
+        """
+        Store a document in the cache. The entry is written to a temporary folder first and then moved, so that no
+        incomplete entries can be loaded.
+        :param key: Key of the document.
+        :param document: pandas.DataFrame of the document.
+        """
+        temporary_folder = tempfile.mkdtemp(dir=self.cache_folder, prefix='.tmp-')
+        for column in CorpusLoader.COLUMNS:
+            values = document[column].to_numpy()
+            if values.dtype == object:
+                missing = pd.isna(values)
+                if missing.any():
+                    np.save(os.path.join(temporary_folder, column + '_missing.npy'), missing)
+                    values = np.where(missing, '', values)
+                values = values.astype(str)
+            np.save(os.path.join(temporary_folder, column + '.npy'), values)
+        try:
+            os.rename(temporary_folder, os.path.join(self.cache_folder, key))
+        except OSError:
+            # Another process stored the same entry in the meantime.
+            shutil.rmtree(temporary_folder)
@@ -0,0 +1,145 @@
+import csv
+import glob
+import hashlib
+import os
+from itertools import zip_longest
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+class CorpusLoader:
+    """
+    CorpusLoader reads the corpus from a root folder in which every document is stored as a txt file (one line of the
+    documentation per line) and a csv file with the same name (one row of labels per line). Documents are read one at
+    a time, so that only a single document has to be held in memory besides the resulting pandas.DataFrame.
+    """
+    COLUMNS = ['document', 'line', 'design_decision', 'classification', 'alternative_classification']
+    CATEGORICAL_COLUMNS = ['document', 'classification', 'alternative_classification']
+
+    def __init__(self, csv_separator=';', encoding='utf-8'):
+        """
+        Create a loader for corpora with the given file format.
+        :param csv_separator: Separator of the values in the csv files.
+        :param encoding: Encoding of the txt and csv files.
+        """
+        self.csv_separator = csv_separator
+        self.encoding = encoding
+
+    def find_documents(self, root_folder: str):
+        """
+        Pair the txt and csv files in the root folder by their file name. The case of the file names is ignored, so
+        e.g. 'ZenGarden.txt' and 'Zengarden.csv' belong to the same document.
+        :param root_folder: Folder with the corpus.
+        :return: List of tuples (document name, txt file, csv file), ordered by the path of the txt file (as the sorted
+                 glob of the original notebook, so that the rows and thus the folds of a seeded cross-validation stay
+                 the same). The name of the txt file is used as document name.
+        :raises ValueError: If a txt file has no corresponding csv file or vice versa.
+        """
+        txt_files = self.__files_by_name(root_folder, "*.txt")
+        csv_files = self.__files_by_name(root_folder, "*.csv")
+        if txt_files.keys() != csv_files.keys():
+            raise ValueError("Documents without txt or csv file: " + str(sorted(txt_files.keys() ^ csv_files.keys())))
+        return [(os.path.splitext(os.path.basename(txt_files[name]))[0], txt_files[name], csv_files[name])
+                for name in sorted(txt_files, key=txt_files.get)]
+
+    def fingerprint_document(self, txt_file: str, csv_file: str, block_size=1 << 20):
+        """
+        Compute a fingerprint of the content of a document, which changes if its txt or csv file changes.
+        :param txt_file: Path to the txt file.
+        :param csv_file: Path to the csv file.
+        :param block_size: Number of bytes read at once.
+        :return: Hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        for file_name in (txt_file, csv_file):
+            digest.update(os.path.getsize(file_name).to_bytes(8, 'little'))
+            with open(file_name, 'rb') as file:
+                for block in iter(lambda: file.read(block_size), b''):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def read_document(self, document_name: str, txt_file: str, csv_file: str):
+        """
+        Extract the lines and their labels from a txt and the corresponding csv file. Both files are streamed line by
+        line. Not-meaningful linebreaks are removed and empty lines are skipped.
+        :param document_name: Name of the document, which is written to column 'document'.
+        :param txt_file: Path to the txt file.
+        :param csv_file: Path to the csv file with the columns 'design_decision', 'classification' and
+                'alternative_classification'.
+        :return: pandas.DataFrame with the columns in COLUMNS and one row per non-empty line.
+        :raises ValueError: If the number of lines in the txt file and rows in the csv file differ.
+        """
+        lines, design_decisions, labels, alternative_labels = [], [], [], []
+        with open(txt_file, 'r', encoding=self.encoding) as txt, \
+                open(csv_file, 'r', encoding=self.encoding, newline='') as classifications:
+            rows = csv.DictReader(classifications, delimiter=self.csv_separator)
+            for line, row in zip_longest(txt, rows):
+                if line is None or row is None:
+                    raise ValueError("Number of lines and labels differ for document " + document_name)
+                line = line.replace("\n", "")
+                if line == '':
+                    continue
+                lines.append(line)
+                design_decisions.append(int(row['design_decision']))
+                labels.append(row['classification'].strip())
+                alternative_labels.append(row['alternative_classification'].strip())
+
+        document = pd.DataFrame({
+            'document': pd.Categorical([document_name] * len(lines)),
+            'line': lines,
+            'design_decision': np.array(design_decisions, dtype=np.int64),
+            'classification': pd.Categorical(labels),
+            'alternative_classification': pd.Categorical(alternative_labels)
+        }, columns=self.COLUMNS)
+        return document
+
+    def iterate_documents(self, root_folder: str):
+        """
+        Generator which reads the documents of the corpus lazily, one document per iteration.
+        :param root_folder: Folder with the corpus.
+        :return: Generator of pandas.DataFrame, one per document (see read_document()).
+        """
+        for document_name, txt_file, csv_file in self.find_documents(root_folder):
+            yield self.read_document(document_name, txt_file, csv_file)
+
+    def generate_data_frame(self, root_folder: str):
+        """
+        Generate a pandas.DataFrame from the source files stored in the root folder. All lines should be stored in txt
+        files and the labels in the corresponding csv file with the same name.
+        :param root_folder: Folder with the corpus.
+        :return: pandas.DataFrame with the columns in COLUMNS, where the columns in CATEGORICAL_COLUMNS are categorical.
+        """
+        return self.concatenate_documents(self.iterate_documents(root_folder))
+
+    def concatenate_documents(self, documents):
+        """
+        Combine documents to one corpus in a single concatenation per column. The columns in CATEGORICAL_COLUMNS are
+        converted to categorical columns with the union of the categories of all documents.
+        :param documents: Iterable of pandas.DataFrame with the columns in COLUMNS.
+        :return: pandas.DataFrame with the rows of all documents in the given order.
+        """
+        columns = {column: [] for column in self.COLUMNS}
+        for document in documents:
+            for column in self.COLUMNS:
+                values = document[column]
+                columns[column].append(pd.Categorical(values) if column in self.CATEGORICAL_COLUMNS
+                                       else np.asarray(values))
+
+        if not columns['line']:
+            return pd.DataFrame(columns=self.COLUMNS)
+        corpus = pd.DataFrame({
+            column: union_categoricals(values) if column in self.CATEGORICAL_COLUMNS else np.concatenate(values)
+            for column, values in columns.items()
+        }, columns=self.COLUMNS)
+        return corpus
+
+    def __files_by_name(self, root_folder: str, pattern: str):
+        """
+        Find all files matching 'pattern' in the root folder.
+        :param root_folder: Folder with the corpus.
+        :param pattern: Glob pattern for the files.
+        :return: Dictionary which maps the lowercase file name without extension to the path of the file.
+        """
+        return {os.path.splitext(os.path.basename(path))[0].lower(): path
+                for path in glob.glob(os.path.join(root_folder, pattern))}
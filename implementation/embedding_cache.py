@@ -0,0 +1,233 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from instrumentation import instrumentation
+
+try:
+    import torch
+    from transformers import AutoConfig, AutoModel, AutoTokenizer
+except ImportError:
+    # Only needed to encode lines which are not cached yet.
+    torch = None
+
+
+class SentenceEmbeddingCache:
+    """
+    SentenceEmbeddingCache computes sentence embeddings with a transformer encoder (e.g. BERT) on the CPU and stores
+    them on disk, so that every line is encoded only once per model. The embedding of a line is the mean of the token
+    embeddings of the last layer. The embeddings are stored in shards (numpy arrays with one row per line and a JSON
+    index of the SHA-256 digests of the lines), which are memory-mapped when they are loaded. As the lines are
+    identified by their text, differently preprocessed lines get their own embeddings. The encoder is only loaded if
+    lines are missing; it requires the optional packages torch and transformers.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_folder: str, model_name='bert-base-uncased', max_length=128, batch_size=32,
+                 quantize=False):
+        """
+        Create a cache for the embeddings of one model.
+        :param cache_folder: Folder for the embeddings, which is created if it does not exist.
+        :param model_name: Name or path of the model for transformers.AutoModel.
+        :param max_length: Maximum number of tokens per line, longer lines are truncated.
+        :param batch_size: Number of lines encoded together.
+        :param quantize: if set to true, the linear layers of the encoder are quantized to int8 with
+                torch.quantization.quantize_dynamic, which is faster on CPUs but changes the embeddings slightly
+        """
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.quantize = quantize
+        configuration = json.dumps([self.FORMAT_VERSION, model_name, max_length, quantize])
+        self.cache_folder = os.path.join(cache_folder, hashlib.sha256(configuration.encode('utf-8')).hexdigest())
+        os.makedirs(self.cache_folder, exist_ok=True)
+        if not os.path.isfile(os.path.join(self.cache_folder, 'configuration.json')):
+            self.__write_file('configuration.json', lambda file: file.write(configuration.encode('utf-8')))
+        self.__tokenizer = None
+        self.__model = None
+
+    def __getstate__(self):
+        """
+        The loaded encoder is not pickled (e.g. when a vectorizer is sent to worker processes), it is loaded again if
+        needed.
+        :return: Attributes of the cache.
+        """
+        state = self.__dict__.copy()
+        state['_SentenceEmbeddingCache__tokenizer'] = None
+        state['_SentenceEmbeddingCache__model'] = None
+        return state
+
+    def get_embeddings(self, lines):
+        """
+        Returns the embeddings of the lines. Lines which are not cached yet are encoded (each distinct line once) and
+        stored in a new shard.
+        :param lines: Iterable of lines.
+        :return: numpy.ndarray (float32) with one row per line, also for an empty iterable.
+        """
+        lines = [str(line) for line in lines]
+        line_digests = [hashlib.sha256(line.encode('utf-8')).hexdigest() for line in lines]
+        index = self.__load_index()
+        missing_lines = dict()
+        for line, digest in zip(lines, line_digests):
+            if digest not in index:
+                missing_lines.setdefault(digest, line)
+        if missing_lines:
+            instrumentation.count('embedding_encoded_lines', len(missing_lines))
+            with instrumentation.stage('SentenceEmbeddingCache.encode'):
+                embeddings = self.__encode(list(missing_lines.values()))
+            self.__store_shard(list(missing_lines), embeddings)
+            index = self.__load_index()
+
+        shards = dict()
+        rows = []
+        for digest in line_digests:
+            shard, row = index[digest]
+            if shard not in shards:
+                shards[shard] = np.load(os.path.join(self.cache_folder, shard + '.npy'), mmap_mode='r')
+            rows.append(shards[shard][row])
+        if not rows:
+            return np.zeros((0, self.__get_hidden_size(index)), dtype=np.float32)
+        return np.stack(rows).astype(np.float32, copy=False)
+
+    def __get_hidden_size(self, index: dict):
+        """
+        Determine the size of the embeddings, from a stored shard if possible, otherwise from the model configuration.
+        :param index: Index of the stored shards, see __load_index.
+        :return: Number of columns of an embedding.
+        :raises ImportError: If no shard is stored and transformers is not installed.
+        """
+        for shard, _ in index.values():
+            return np.load(os.path.join(self.cache_folder, shard + '.npy'), mmap_mode='r').shape[1]
+        if torch is None:
+            raise ImportError("Determining the embedding size requires the packages 'torch' and 'transformers'")
+        return AutoConfig.from_pretrained(self.model_name).hidden_size
+
+    def __load_index(self):
+        """
+        Read the indices of all complete shards.
+        :return: Dictionary which maps the digest of a line to a tuple (shard, row).
+        """
+        index = dict()
+        for index_file in glob.glob(os.path.join(self.cache_folder, '*.json')):
+            shard = os.path.splitext(os.path.basename(index_file))[0]
+            if shard == 'configuration':
+                continue
+            with open(index_file, 'r') as file:
+                for row, digest in enumerate(json.load(file)):
+                    index.setdefault(digest, (shard, row))
+        return index
+
+    def __store_shard(self, digests: list, embeddings: np.ndarray):
+        """
+        Store embeddings as new shard. The embeddings are moved to their final name first and the index last, so that
+        only complete shards are used.
+        :param digests: Digests of the lines.
+        :param embeddings: Embeddings of the lines.
+        """
+        shard = hashlib.sha256(''.join(digests).encode('utf-8')).hexdigest()
+        self.__write_file(shard + '.npy', lambda file: np.save(file, embeddings))
+        self.__write_file(shard + '.json', lambda file: file.write(json.dumps(digests).encode('utf-8')))
+
+    def __write_file(self, file_name: str, write):
+        """
+        Write a file of the cache folder atomically: it is written to a temporary file first, which is then moved.
+        :param file_name: Name of the file in the cache folder.
+        :param write: Function which writes the content to a binary file object.
+        """
+        file_descriptor, temporary_file = tempfile.mkstemp(dir=self.cache_folder, prefix='.tmp-')
+        with os.fdopen(file_descriptor, 'wb') as file:
+            write(file)
+        os.replace(temporary_file, os.path.join(self.cache_folder, file_name))
+
+    def __encode(self, lines: list):
+        """
+        Encode lines with the model. The lines are sorted by length, so that each batch needs little padding.
+        :param lines: Lines to encode.
+        :return: numpy.ndarray (float32) with the embedding of each line.
+        """
+        tokenizer, model = self.__get_model()
+        order = sorted(range(len(lines)), key=lambda position: len(lines[position]))
+        embeddings = np.zeros((len(lines), model.config.hidden_size), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(lines), self.batch_size):
+                batch_positions = order[start:start + self.batch_size]
+                inputs = tokenizer([lines[position] for position in batch_positions], padding=True, truncation=True,
+                                   max_length=self.max_length, return_tensors='pt')
+                token_embeddings = model(**inputs).last_hidden_state
+                mask = inputs['attention_mask'].unsqueeze(-1).to(token_embeddings.dtype)
+                mean_embeddings = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                embeddings[batch_positions] = mean_embeddings.numpy()
+        return embeddings
+
+    def __get_model(self):
+        """
+        Load the tokenizer and the encoder (quantized if selected) once.
+        :return: Tuple (tokenizer, model).
+        :raises ImportError: If torch or transformers is not installed.
+        """
+        if self.__model is None:
+            if torch is None:
+                raise ImportError("Encoding lines requires the packages 'torch' and 'transformers'")
+            self.__tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModel.from_pretrained(self.model_name).eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.__model = model
+        return self.__tokenizer, self.__model
+
+
+class EmbeddingVectorizer(TransformerMixin, BaseEstimator):
+    """
+    Vectorizer (sklearn transformer) which returns the cached sentence embeddings of the lines (see
+    SentenceEmbeddingCache), so that it can be evaluated like the other vectorizers, e.g. with EvaluationEngine and a
+    lightweight classifier such as LogisticRegression. As the encoder is not trained, fitting does nothing. Call
+    transform on all lines once before the evaluation, so that the worker processes only read the cache. The
+    SentenceEmbeddingCache is created on the first call of transform and kept, so that the encoder is loaded only once.
+    """
+    def __init__(self, cache_folder='embeddings', model_name='bert-base-uncased', max_length=128, batch_size=32,
+                 quantize=False):
+        """
+        Create the vectorizer, the parameters are passed to SentenceEmbeddingCache.
+        :param cache_folder: Folder for the embeddings.
+        :param model_name: Name or path of the model for transformers.AutoModel.
+        :param max_length: Maximum number of tokens per line.
+        :param batch_size: Number of lines encoded together.
+        :param quantize: if set to true, the encoder is quantized to int8
+        """
+        self.cache_folder = cache_folder
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.quantize = quantize
+
+    def fit(self, lines, y=None):
+        """
+        Nothing to fit, the encoder is pretrained.
+        :param lines: Lines (ignored).
+        :param y: Labels (ignored).
+        :return: self
+        """
+        return self
+
+    def transform(self, lines):
+        """
+        Returns the embeddings of the lines.
+        :param lines: Iterable of lines.
+        :return: numpy.ndarray with one row per line.
+        """
+        return self.__get_embedding_cache().get_embeddings(lines)
+
+    def __get_embedding_cache(self):
+        """
+        Returns the embedding cache for the current parameters, which is created again if they were changed (e.g. by
+        set_params).
+        :return: SentenceEmbeddingCache
+        """
+        parameters = (self.cache_folder, self.model_name, self.max_length, self.batch_size, self.quantize)
+        if getattr(self, '_EmbeddingVectorizer__parameters', None) != parameters:
+            self.__embedding_cache = SentenceEmbeddingCache(*parameters)
+            self.__parameters = parameters
+        return self.__embedding_cache
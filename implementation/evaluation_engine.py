@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+from feature_cache import FoldFeatureCache
+from instrumentation import instrumentation, run_in_worker
+
+
+class EvaluationEngine:
+    """
+    EvaluationEngine evaluates every combination of classifier and vectorizer with cross-validation. The folds of all
+    vectorizers are distributed over a pool of worker processes. Each vectorizer is fitted only once per fold and its
+    features are shared by all classifiers (see FoldFeatureCache), which gives the same results as fitting a
+    sklearn.pipeline.Pipeline per combination. If a checkpoint folder is given, the scores of every finished fold of a
+    combination are saved there under a fingerprint of the data in the fold, so that an interrupted evaluation
+    continues with the missing folds when it is started again and folds whose data did not change are not evaluated
+    again, even if the data points moved to other indices. After each evaluation, 'statistics' holds the number of
+    computed and reused fold results. With evaluate_hierarchical, the classifiers are trained once on fine-grained
+    labels and their predictions are rolled up to coarser levels of classification, which are all scored in the same
+    pass.
+    """
+    def __init__(self, classifiers, vectorizers, scoring: dict, cv, n_jobs=-1, checkpoint_folder=None,
+                 feature_cache_folder=None):
+        """
+        Create an engine for the evaluation of all classifier-vectorizer-combinations.
+        :param classifiers: List of all classifiers to evaluate (sklearn estimators).
+        :param vectorizers: List of all vectorizers to evaluate (sklearn transformers).
+        :param scoring: Dictionary which maps the name of a metric to a scorer, e.g. generated by
+                sklearn.metrics.make_scorer.
+        :param cv: Cross-validation splitter, e.g. sklearn.model_selection.RepeatedKFold.
+        :param n_jobs: Number of worker processes, -1 uses all available CPUs.
+        :param checkpoint_folder: Folder for the scores of finished folds or None to disable checkpoints.
+        :param feature_cache_folder: Folder in which the feature matrices of every vectorizer and fold are stored
+                memory-mapped, so that later evaluations (e.g. with other classifiers) can reuse them. If None, the
+                features are only kept during the evaluation of a fold.
+        """
+        self.classifiers = classifiers
+        self.vectorizers = vectorizers
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.checkpoint_folder = checkpoint_folder
+        self.feature_cache = FoldFeatureCache(feature_cache_folder)
+        self.statistics = dict()
+        if checkpoint_folder is not None:
+            os.makedirs(checkpoint_folder, exist_ok=True)
+
+    def evaluate(self, lines, labels, groups=None):
+        """
+        Run the cross-validation for all classifier-vectorizer-combinations and folds which have no checkpoint yet. The
+        score of a combination is the average over all folds.
+        :param lines: Input for the vectorizers, one entry per data point.
+        :param labels: Labels of the data points (1D for single label, 2D for multi label).
+        :param groups: Group labels for the data points, which are passed to the split method of 'cv'.
+        :return: Dictionary which maps every metric name from 'scoring' to a numpy.ndarray with one row per
+                 classifier and one column per vectorizer.
+        """
+        return self.__evaluate(lines, labels, groups, None)[None]
+
+    def evaluate_hierarchical(self, lines, labels, level_labels: dict, label_mappings: dict, groups=None,
+                              level_scoring=None):
+        """
+        Run the cross-validation like evaluate(), but score every fitted classifier on several levels of
+        classification at once: the predictions for the (fine-grained) 'labels' are rolled up with the label mapping of
+        each level and scored against the true labels on that level. Therefore, the vectorizers and classifiers are
+        fitted only once for all levels. The rolled-up scores are not the scores of classifiers trained on the coarser
+        level and are usually lower: the classifiers are optimized to separate the many fine-grained classes, which
+        are small and often confused with the unrelated class, instead of the coarser decision (e.g. on the bundled
+        corpus, classifiers trained on LEAVES score clearly lower on LEVEL_0 and LEVEL_1 than classifiers trained on
+        these levels). Besides, data points labelled with an inner class of the scheme (e.g. 'technological' on level
+        LEAVES) are unrelated on the training level, so their class on a coarser level can never be predicted. The
+        scorers must only use predict of the classifiers.
+        :param lines: Input for the vectorizers, one entry per data point.
+        :param labels: Integer labels of the data points the classifiers are trained on (single label).
+        :param level_labels: Dictionary which maps the name of a level to the true integer labels on this level.
+        :param label_mappings: Dictionary which maps the name of a level to the numpy.ndarray that holds the integer
+                label on this level for every integer label in 'labels', see
+                LabelPreprocessor.generate_integer_label_mapping.
+        :param groups: Group labels for the data points, which are passed to the split method of 'cv'.
+        :param level_scoring: Dictionary which maps the name of a level to its own scoring dictionary, e.g. with binary
+                averaging for levels with two classes. Levels without an entry are scored with 'scoring'.
+        :return: Dictionary which maps the name of every level to the dictionary of score matrices as returned by
+                 evaluate() for the metrics of the level.
+        """
+        labels = np.asarray(labels)
+        if labels.ndim != 1:
+            raise ValueError("Hierarchical evaluation requires single labels")
+        hierarchy = dict()
+        for level, label_mapping in label_mappings.items():
+            label_mapping = np.asarray(label_mapping)
+            true_labels = np.asarray(level_labels[level])
+            hierarchy[level] = (true_labels, label_mapping, np.unique(np.concatenate([true_labels, label_mapping])),
+                                (level_scoring or dict()).get(level, self.scoring))
+        return self.__evaluate(lines, labels, groups, hierarchy)
+
+    def __evaluate(self, lines, labels, groups, hierarchy):
+        """
+        Run the cross-validation for all combinations and folds which have no checkpoint yet.
+        :param lines: Input for the vectorizers.
+        :param labels: Labels of the data points.
+        :param groups: Group labels for the data points.
+        :param hierarchy: Dictionary which maps the name of a level to a tuple (true labels, label mapping, classes,
+                scoring) or None to score the predictions for 'labels' directly.
+        :return: Dictionary which maps the name of every level (None without hierarchy) to the score matrices.
+        """
+        lines = np.asarray(lines, dtype=object)
+        labels = np.asarray(labels)
+        splits = list(self.cv.split(lines, labels, groups))
+        lines_fingerprint = self.feature_cache.fingerprint_lines(lines)
+        data_point_fingerprints = self.__fingerprint_data_points(lines, labels, hierarchy)
+        fold_fingerprints = [self.__fingerprint_fold(data_point_fingerprints, train_index, test_index, hierarchy)
+                             for train_index, test_index in splits]
+        levels = [None] if hierarchy is None else list(hierarchy)
+
+        fold_scores = dict()
+        open_classifiers = dict()
+        for i in range(len(self.classifiers)):
+            for j in range(len(self.vectorizers)):
+                fold_scores[i, j] = [self.__load_checkpoint(i, j, fold_fingerprint, hierarchy)
+                                     for fold_fingerprint in fold_fingerprints]
+                for fold, scores_of_fold in enumerate(fold_scores[i, j]):
+                    if scores_of_fold is None:
+                        open_classifiers.setdefault((j, fold), []).append(i)
+        open_folds = sorted(open_classifiers)
+        self.statistics = {'folds': len(splits), 'computed_fold_results': sum(map(len, open_classifiers.values())),
+                           'reused_fold_results': len(fold_scores) * len(splits)
+                           - sum(map(len, open_classifiers.values()))}
+
+        if open_folds:
+            tasks = (delayed(run_in_worker)(instrumentation.enabled, _evaluate_fold, self.vectorizers[j],
+                                            [self.classifiers[i] for i in open_classifiers[j, fold]], lines, labels,
+                                            splits[fold][0], splits[fold][1], self.scoring, self.feature_cache,
+                                            lines_fingerprint, hierarchy)
+                     for j, fold in open_folds)
+            fold_results = Parallel(n_jobs=self.n_jobs, return_as='generator')(tasks)
+            for (j, fold), (scores_of_classifiers, records) in zip(open_folds, fold_results):
+                instrumentation.merge(records)
+                for i, scores_of_fold in zip(open_classifiers[j, fold], scores_of_classifiers):
+                    self.__save_checkpoint(i, j, fold_fingerprints[fold], hierarchy, scores_of_fold)
+                    fold_scores[i, j][fold] = scores_of_fold
+
+        level_metrics = {level: list(self.scoring if level is None else hierarchy[level][3]) for level in levels}
+        scores = {level: {metric: np.zeros((len(self.classifiers), len(self.vectorizers)))
+                          for metric in level_metrics[level]}
+                  for level in levels}
+        for (i, j), scores_of_folds in fold_scores.items():
+            for level in levels:
+                for metric in level_metrics[level]:
+                    scores[level][metric][i, j] = np.mean([fold[level][metric] for fold in scores_of_folds])
+        return scores
+
+    def __fingerprint_data_points(self, lines: np.ndarray, labels: np.ndarray, hierarchy):
+        """
+        Compute a fingerprint of every data point from its line and labels.
+        :param lines: Input for the vectorizers.
+        :param labels: Labels of the data points.
+        :param hierarchy: Levels the predictions are rolled up to (see __evaluate) or None.
+        :return: List with the SHA-256 digest (bytes) of each data point.
+        """
+        level_labels = [] if hierarchy is None else [hierarchy[level][0] for level in sorted(hierarchy)]
+        fingerprints = []
+        for position, line in enumerate(lines):
+            digest = hashlib.sha256()
+            encoded_line = str(line).encode('utf-8')
+            digest.update(len(encoded_line).to_bytes(8, 'little'))
+            digest.update(encoded_line)
+            digest.update(repr([labels[position].tolist()] + [true_labels[position].tolist()
+                                                               for true_labels in level_labels]).encode('utf-8'))
+            fingerprints.append(digest.digest())
+        return fingerprints
+
+    def __fingerprint_fold(self, data_point_fingerprints: list, train_index, test_index, hierarchy):
+        """
+        Compute a fingerprint of a fold from the data points in its training and test data (in their order), so that
+        checkpoints are only used for the same data, but also if the data points moved to other indices.
+        :param data_point_fingerprints: Fingerprints of all data points.
+        :param train_index: Indices of the training data.
+        :param test_index: Indices of the test data.
+        :param hierarchy: Levels the predictions are rolled up to (see __evaluate) or None.
+        :return: Hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        if hierarchy is not None:
+            for level, (_, label_mapping, _, level_scoring) in sorted(hierarchy.items()):
+                digest.update(repr([level, label_mapping.tolist(),
+                                    sorted((metric, repr(scorer)) for metric, scorer in level_scoring.items())])
+                              .encode('utf-8'))
+        digest.update(b''.join(data_point_fingerprints[i] for i in train_index))
+        digest.update(b'|')
+        digest.update(b''.join(data_point_fingerprints[i] for i in test_index))
+        return digest.hexdigest()
+
+    def __get_checkpoint_file(self, i: int, j: int, fold_fingerprint: str):
+        """
+        Determine the checkpoint file of a fold of a combination. Its name depends on the configuration of the
+        classifier and vectorizer, the scoring and the data of the fold.
+        :param i: Index of the classifier.
+        :param j: Index of the vectorizer.
+        :param fold_fingerprint: Fingerprint of the fold.
+        :return: Path to the checkpoint file or None if checkpoints are disabled.
+        """
+        if self.checkpoint_folder is None:
+            return None
+        configuration = [repr(self.classifiers[i]), repr(self.vectorizers[j]),
+                         sorted((metric, repr(scorer)) for metric, scorer in self.scoring.items()), fold_fingerprint]
+        key = hashlib.sha256(json.dumps(configuration).encode('utf-8')).hexdigest()
+        return os.path.join(self.checkpoint_folder, key + '.json')
+
+    def __load_checkpoint(self, i: int, j: int, fold_fingerprint: str, hierarchy):
+        """
+        Load the scores of a fold of a combination from its checkpoint.
+        :param i: Index of the classifier.
+        :param j: Index of the vectorizer.
+        :param fold_fingerprint: Fingerprint of the fold.
+        :param hierarchy: Levels the predictions are rolled up to (see __evaluate) or None.
+        :return: Dictionary which maps every level (None without hierarchy) to the scores of the metrics or None if
+                 there is no checkpoint.
+        """
+        checkpoint_file = self.__get_checkpoint_file(i, j, fold_fingerprint)
+        if checkpoint_file is None or not os.path.isfile(checkpoint_file):
+            return None
+        with open(checkpoint_file, 'r') as file:
+            scores_of_fold = json.load(file)['scores']
+        return {None: scores_of_fold} if hierarchy is None else scores_of_fold
+
+    def __save_checkpoint(self, i: int, j: int, fold_fingerprint: str, hierarchy, scores_of_fold: dict):
+        """
+        Save the scores of a fold of a combination to its checkpoint. The file is replaced atomically.
+        :param i: Index of the classifier.
+        :param j: Index of the vectorizer.
+        :param fold_fingerprint: Fingerprint of the fold.
+        :param hierarchy: Levels the predictions are rolled up to (see __evaluate) or None.
+        :param scores_of_fold: Dictionary which maps every level (None without hierarchy) to the scores of the metrics.
+        """
+        checkpoint_file = self.__get_checkpoint_file(i, j, fold_fingerprint)
+        if checkpoint_file is None:
+            return
+        checkpoint = {'classifier': repr(self.classifiers[i]), 'vectorizer': repr(self.vectorizers[j]),
+                      'scores': scores_of_fold[None] if hierarchy is None else scores_of_fold}
+        with open(checkpoint_file + '.tmp', 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+
+class _FixedPredictions(ClassifierMixin, BaseEstimator):
+    """
+    Classifier which returns predictions computed beforehand, so that sklearn scorers can score predictions which were
+    rolled up to another level of classification.
+    """
+    def __init__(self, predictions=None, classes=None):
+        self.predictions = predictions
+        self.classes = classes
+
+    @property
+    def classes_(self):
+        return self.classes
+
+    def predict(self, features):
+        return self.predictions
+
+
+def _evaluate_fold(vectorizer, classifiers: list, lines: np.ndarray, labels: np.ndarray, train_index, test_index,
+                   scoring: dict, feature_cache: FoldFeatureCache, lines_fingerprint: str, hierarchy=None):
+    """
+    Fit (copies of) the classifiers on the features of the training data of a fold and score them on the features of
+    the test data. The vectorizer is fitted once on the training data, so every classifier is scored as a
+    sklearn.pipeline.Pipeline of the vectorizer and the classifier would be in sklearn.model_selection.cross_validate.
+    :param vectorizer: Vectorizer which generates the features.
+    :param classifiers: Classifiers to evaluate.
+    :param lines: Input for the vectorizer.
+    :param labels: Labels of the data points.
+    :param train_index: Indices of the training data.
+    :param test_index: Indices of the test data.
+    :param scoring: Dictionary which maps the name of a metric to a scorer.
+    :param feature_cache: Cache for the feature matrices of the fold.
+    :param lines_fingerprint: Fingerprint of 'lines' for the feature cache.
+    :param hierarchy: Dictionary which maps the name of a level to a tuple (true labels, label mapping, classes,
+            scoring) to score the rolled up predictions on each level, None to score the classifiers directly.
+    :return: List with one dictionary per classifier, which maps the name of every level (None without hierarchy) to a
+             dictionary with the score on the test data for every metric name.
+    """
+    with instrumentation.stage('EvaluationEngine.vectorize'):
+        train_features, test_features = feature_cache.get_features(vectorizer, lines, train_index, test_index,
+                                                                   lines_fingerprint)
+    fold_scores = []
+    for classifier in classifiers:
+        with instrumentation.stage('EvaluationEngine.fit'):
+            fitted_classifier = clone(classifier).fit(train_features, labels[train_index])
+        with instrumentation.stage('EvaluationEngine.score'):
+            if hierarchy is None:
+                fold_scores.append({None: {metric: float(scorer(fitted_classifier, test_features, labels[test_index]))
+                                           for metric, scorer in scoring.items()}})
+                continue
+            predictions = fitted_classifier.predict(test_features)
+            level_scores = dict()
+            for level, (true_labels, label_mapping, classes, level_scoring) in hierarchy.items():
+                rolled_up_classifier = _FixedPredictions(label_mapping[predictions], classes)
+                level_scores[level] = {metric: float(scorer(rolled_up_classifier, test_features,
+                                                            true_labels[test_index]))
+                                       for metric, scorer in level_scoring.items()}
+            fold_scores.append(level_scores)
+    return fold_scores
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from instrumentation import instrumentation
+
+
+class FoldFeatureCache:
+    """
+    FoldFeatureCache fits a vectorizer only once per fold and keeps the resulting feature matrices of the training and
+    test data, so that all classifiers evaluated on this fold can reuse them. Sparse matrices are kept as
+    scipy.sparse.csr_matrix and dense ones (e.g. embeddings) as numpy.ndarray. If a cache folder is given, all matrices
+    are saved as numpy arrays which are memory-mapped when they are loaded again, e.g. by another worker process or a
+    later evaluation. Besides, the most recently used matrices are kept in memory, which only helps if the same fold is
+    requested again in the same process (e.g. repeated evaluations with n_jobs=1); EvaluationEngine requests every
+    (vectorizer, fold) only once per evaluation.
+    """
+    def __init__(self, cache_folder=None, mmap_mode='c', max_entries_in_memory=1):
+        """
+        Create a feature cache.
+        :param cache_folder: Folder to store the feature matrices in or None to keep them in memory only.
+        :param mmap_mode: Mode for numpy.load when matrices are loaded from the cache folder, None to read them
+                completely into memory. The default copy-on-write mode allows estimators to modify the matrices in
+                place (e.g. sorting indices) without changing the stored files.
+        :param max_entries_in_memory: Number of folds whose matrices are kept in memory within this process, the least
+                recently used ones are dropped. Reuse across processes and evaluations relies on 'cache_folder'.
+        """
+        self.cache_folder = cache_folder
+        self.mmap_mode = mmap_mode
+        self.max_entries_in_memory = max_entries_in_memory
+        self.__features = OrderedDict()
+        if cache_folder is not None:
+            os.makedirs(cache_folder, exist_ok=True)
+
+    def __getstate__(self):
+        """
+        Features kept in memory are not sent to other processes, they use the cache folder instead.
+        :return: State of the cache for pickling.
+        """
+        state = self.__dict__.copy()
+        state['_FoldFeatureCache__features'] = OrderedDict()
+        return state
+
+    def fingerprint_lines(self, lines):
+        """
+        Compute a fingerprint of the input data, which is part of the key of all feature matrices computed from it.
+        :param lines: Input for the vectorizers.
+        :return: Hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        for line in lines:
+            encoded_line = str(line).encode('utf-8')
+            digest.update(len(encoded_line).to_bytes(8, 'little'))
+            digest.update(encoded_line)
+        return digest.hexdigest()
+
+    def get_features(self, vectorizer, lines: np.ndarray, train_index, test_index, lines_fingerprint=None):
+        """
+        Return the feature matrices of a fold. If they are not cached yet, a copy of the vectorizer is fitted on the
+        training data and applied to the training and test data.
+        :param vectorizer: Vectorizer (sklearn transformer) which generates the features.
+        :param lines: Input for the vectorizer.
+        :param train_index: Indices of the training data.
+        :param test_index: Indices of the test data.
+        :param lines_fingerprint: Result of fingerprint_lines(lines), computed if None.
+        :return: Tuple (features of training data, features of test data) as scipy.sparse.csr_matrix if the vectorizer
+                 returns sparse matrices, otherwise as numpy.ndarray.
+        """
+        if lines_fingerprint is None:
+            lines_fingerprint = self.fingerprint_lines(lines)
+        key = self.__compute_key(vectorizer, train_index, test_index, lines_fingerprint)
+        features = self.__features.get(key)
+        if features is None:
+            features = self.__load(key)
+        if features is None:
+            instrumentation.count('vectorizer_fit')
+            fitted_vectorizer = clone(vectorizer)
+            features = (self.__normalize_matrix(fitted_vectorizer.fit_transform(lines[train_index])),
+                        self.__normalize_matrix(fitted_vectorizer.transform(lines[test_index])))
+            self.__store(key, features)
+        self.__features[key] = features
+        self.__features.move_to_end(key)
+        while len(self.__features) > self.max_entries_in_memory:
+            self.__features.popitem(last=False)
+        return features
+
+    def clear(self):
+        """
+        Remove all feature matrices from memory and the cache folder.
+        """
+        self.__features.clear()
+        if self.cache_folder is not None:
+            for key in os.listdir(self.cache_folder):
+                shutil.rmtree(os.path.join(self.cache_folder, key), ignore_errors=True)
+
+    def __compute_key(self, vectorizer, train_index, test_index, lines_fingerprint: str):
+        """
+        Compute the key of the feature matrices of a fold.
+        :param vectorizer: Vectorizer which generates the features.
+        :param train_index: Indices of the training data.
+        :param test_index: Indices of the test data.
+        :param lines_fingerprint: Fingerprint of the input data.
+        :return: Hexadecimal SHA-256 digest.
+        """
+        digest = hashlib.sha256()
+        digest.update(repr(vectorizer).encode('utf-8'))
+        digest.update(lines_fingerprint.encode('utf-8'))
+        digest.update(np.asarray(train_index, dtype=np.int64).tobytes())
+        digest.update(b'|')
+        digest.update(np.asarray(test_index, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def __normalize_matrix(self, matrix):
+        """
+        Convert the output of a vectorizer to the format in which it is cached. Dense matrices are not converted to
+        sparse ones, which would need more memory and slow down the classifiers.
+        :param matrix: Feature matrix returned by a vectorizer.
+        :return: scipy.sparse.csr_matrix with sorted indices or numpy.ndarray.
+        """
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)
+            matrix.sort_indices()
+            return matrix
+        return np.asarray(matrix)
+
+    def __load(self, key: str):
+        """
+        Load the feature matrices of a fold from the cache folder.
+        :param key: Key of the fold.
+        :return: Tuple (features of training data, features of test data) or None if they are not stored.
+        """
+        if self.cache_folder is None:
+            return None
+        entry_folder = os.path.join(self.cache_folder, key)
+        if not os.path.isdir(entry_folder):
+            return None
+        features = []
+        for part in ('train', 'test'):
+            dense_file = os.path.join(entry_folder, part + '_dense.npy')
+            if os.path.isfile(dense_file):
+                features.append(np.load(dense_file, mmap_mode=self.mmap_mode))
+                continue
+            arrays = [np.load(os.path.join(entry_folder, part + '_' + name + '.npy'), mmap_mode=self.mmap_mode)
+                      for name in ('data', 'indices', 'indptr', 'shape')]
+            features.append(sparse.csr_matrix((arrays[0], arrays[1], arrays[2]), shape=tuple(arrays[3])))
+        return tuple(features)
+
+    def __store(self, key: str, features: tuple):
+        """
+        Save the feature matrices of a fold to the cache folder. The entry is written to a temporary folder first and
+        then moved, so that no incomplete entries can be loaded.
+        :param key: Key of the fold.
+        :param features: Tuple (features of training data, features of test data).
+        """
+        if self.cache_folder is None:
+            return
+        temporary_folder = tempfile.mkdtemp(dir=self.cache_folder, prefix='.tmp-')
+        for part, matrix in zip(('train', 'test'), features):
+            if sparse.issparse(matrix):
+                arrays = {'data': matrix.data, 'indices': matrix.indices, 'indptr': matrix.indptr,
+                          'shape': np.array(matrix.shape, dtype=np.int64)}
+            else:
+                arrays = {'dense': matrix}
+            for name, array in arrays.items():
+                np.save(os.path.join(temporary_folder, part + '_' + name + '.npy'), array)
+        try:
+            os.rename(temporary_folder, os.path.join(self.cache_folder, key))
+        except OSError:
+            # Another process stored the same entry in the meantime.
+            shutil.rmtree(temporary_folder)
@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+from sklearn.model_selection import GroupKFold, LeaveOneGroupOut
+from classification_scheme import ClassificationSchemeBuilder
+from corpus_cache import PreprocessedCorpusCache
+from corpus_loader import CorpusLoader
+from evaluation_engine import EvaluationEngine
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification, TextPreprocessor
+
+
+class IncrementalEvaluation:
+    """
+    IncrementalEvaluation keeps a corpus evaluated while documents are added, modified or removed. A manifest with the
+    fingerprint of every document is kept in the state folder to report the changes since the last update. Only new
+    and modified documents are preprocessed (see PreprocessedCorpusCache), the labels of the whole corpus are unified
+    and encoded again. The folds are formed by documents, either leave-one-document-out or with GroupKFold, and the
+    scores of every fold are checkpointed under a fingerprint of its data (see EvaluationEngine). As every fold
+    contains every document, either for training or testing, any added, modified or removed document changes every
+    fold, so all folds are vectorized and trained again. Fold results are only reused if the data of the fold is
+    unchanged: if the corpus did not change, for additional classifiers and vectorizers, for interrupted updates and
+    if a document is changed back to an earlier version. The scores of each update are compared with those of the last
+    update to report the changed result cells.
+    """
+    MANIFEST_FILE = 'manifest.json'
+    RESULTS_FILE = 'results.json'
+
+    def __init__(self, state_folder: str, text_preprocessor: TextPreprocessor, classifiers, vectorizers, scoring: dict,
+                 level_of_classification=LevelOfClassification.LEAVES, label_unrelated='none of these',
+                 preprocessing_flags=None, n_splits=None, filter_out_non_design_decisions=False, n_jobs=-1):
+        """
+        Create an incremental evaluation whose caches, checkpoints and results are stored in 'state_folder'.
+        :param state_folder: Folder for the state, which is created if it does not exist.
+        :param text_preprocessor: Preprocessor for new and modified documents.
+        :param classifiers: List of all classifiers to evaluate (sklearn estimators).
+        :param vectorizers: List of all vectorizers to evaluate (sklearn transformers).
+        :param scoring: Dictionary which maps the name of a metric to a scorer.
+        :param level_of_classification: Level of classification the labels are unified to.
+        :param label_unrelated: Label for all items that do not fit any class on the level of classification.
+        :param preprocessing_flags: Keyword arguments for TextPreprocessor.preprocess_batch, e.g. do_lowercasing.
+        :param n_splits: Number of folds for GroupKFold or None for leave-one-document-out.
+        :param filter_out_non_design_decisions: if set to true, lines without design decision are not evaluated
+        :param n_jobs: Number of worker processes for the preprocessing and the evaluation, -1 uses all CPUs.
+        """
+        self.state_folder = state_folder
+        self.level_of_classification = level_of_classification
+        self.label_unrelated = label_unrelated
+        self.preprocessing_flags = dict(preprocessing_flags or {})
+        self.filter_out_non_design_decisions = filter_out_non_design_decisions
+        self.n_jobs = n_jobs
+        self.corpus_loader = CorpusLoader()
+        self.corpus_cache = PreprocessedCorpusCache(os.path.join(state_folder, 'corpus'), text_preprocessor,
+                                                    self.corpus_loader)
+        cv = LeaveOneGroupOut() if n_splits is None else GroupKFold(n_splits)
+        self.evaluation_engine = EvaluationEngine(classifiers, vectorizers, scoring, cv, n_jobs=n_jobs,
+                                                  checkpoint_folder=os.path.join(state_folder, 'checkpoints'))
+
+    def update(self, root_folder: str):
+        """
+        Evaluate the current state of the corpus in 'root_folder' and compare it with the last update.
+        :param root_folder: Folder with the corpus (txt and csv files).
+        :return: Dictionary with the names of the 'added', 'modified', 'removed' and 'unchanged' documents, the
+                 'scores' (as returned by EvaluationEngine.evaluate), the 'changed_cells' (list of dictionaries with
+                 metric, classifier, vectorizer, previous and current score) and the numbers of 'computed_fold_results'
+                 and 'reused_fold_results'.
+        """
+        manifest = {document_name: self.corpus_loader.fingerprint_document(txt_file, csv_file)
+                    for document_name, txt_file, csv_file in self.corpus_loader.find_documents(root_folder)}
+        previous_manifest = self.__load_json(self.MANIFEST_FILE) or dict()
+        report = {'added': sorted(manifest.keys() - previous_manifest.keys()),
+                  'modified': sorted(name for name in manifest.keys() & previous_manifest.keys()
+                                     if manifest[name] != previous_manifest[name]),
+                  'removed': sorted(previous_manifest.keys() - manifest.keys()),
+                  'unchanged': sorted(name for name in manifest.keys() & previous_manifest.keys()
+                                      if manifest[name] == previous_manifest[name])}
+
+        corpus = self.corpus_cache.load_preprocessed_corpus(root_folder, n_jobs=self.n_jobs,
+                                                            document_fingerprints=manifest, **self.preprocessing_flags)
+        if self.filter_out_non_design_decisions:
+            corpus = corpus[corpus['design_decision'] != 0]
+        label_preprocessor = LabelPreprocessor()
+        corpus = label_preprocessor.transform_df_unified_labels(
+            corpus, 'classification', ClassificationSchemeBuilder().build_compiled_classification_scheme(),
+            self.level_of_classification, self.label_unrelated)
+        dictionary_for_integer_labels = label_preprocessor.generate_dictionary_for_integer_labels(
+            self.level_of_classification.value, self.label_unrelated)
+        labels = label_preprocessor.encode_integer_labels(corpus, 'classification', dictionary_for_integer_labels)
+
+        scores = self.evaluation_engine.evaluate(corpus['line'], labels, groups=np.asarray(corpus['document']))
+        results = self.__describe_results(scores)
+        report['scores'] = scores
+        report['changed_cells'] = self.__compare_results(results, self.__load_json(self.RESULTS_FILE) or [])
+        report.update(computed_fold_results=self.evaluation_engine.statistics['computed_fold_results'],
+                      reused_fold_results=self.evaluation_engine.statistics['reused_fold_results'])
+
+        self.__save_json(self.RESULTS_FILE, results)
+        self.__save_json(self.MANIFEST_FILE, manifest)
+        self.corpus_cache.remove_unused_entries()
+        return report
+
+    def __describe_results(self, scores: dict):
+        """
+        Convert the score matrices to a list of result cells, which can be compared across updates even if the lists
+        of classifiers and vectorizers change.
+        :param scores: Dictionary with the score matrix for each metric.
+        :return: List of dictionaries with metric, classifier, vectorizer and score.
+        """
+        return [{'metric': metric, 'classifier': repr(classifier), 'vectorizer': repr(vectorizer),
+                 'score': float(matrix[i, j])}
+                for metric, matrix in scores.items()
+                for i, classifier in enumerate(self.evaluation_engine.classifiers)
+                for j, vectorizer in enumerate(self.evaluation_engine.vectorizers)]
+
+    def __compare_results(self, results: list, previous_results: list):
+        """
+        Determine the result cells whose score changed since the last update, including new cells.
+        :param results: Result cells of this update, see __describe_results.
+        :param previous_results: Result cells of the last update.
+        :return: List of dictionaries with metric, classifier, vectorizer, previous score (None for new cells) and
+                 score.
+        """
+        previous_scores = {(cell['metric'], cell['classifier'], cell['vectorizer']): cell['score']
+                           for cell in previous_results}
+        changed_cells = []
+        for cell in results:
+            previous_score = previous_scores.get((cell['metric'], cell['classifier'], cell['vectorizer']))
+            if previous_score is None or not np.isclose(previous_score, cell['score'], rtol=0, atol=1e-12):
+                changed_cells.append(dict(cell, previous_score=previous_score))
+        return changed_cells
+
+    def __load_json(self, file_name: str):
+        """
+        Load a file of the state folder.
+        :param file_name: Name of the file.
+        :return: Content of the file or None if it does not exist.
+        """
+        path = os.path.join(self.state_folder, file_name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r') as file:
+            return json.load(file)
+
+    def __save_json(self, file_name: str, content):
+        """
+        Save a file of the state folder. The file is replaced atomically.
+        :param file_name: Name of the file.
+        :param content: Content which can be serialized to JSON.
+        """
+        path = os.path.join(self.state_folder, file_name)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(content, file, indent=2)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,516 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import make_pipeline
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from classification_scheme import ClassificationSchemeBuilder
+from corpus_loader import CorpusLoader
+from instrumentation import instrumentation
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification, TextPreprocessor
+
+CLASSIFIERS = {
+    'MultinomialNB': lambda: MultinomialNB(),
+    'LogisticRegression': lambda: LogisticRegression(max_iter=500),
+    'SVC': lambda: SVC(),
+    'DecisionTreeClassifier': lambda: DecisionTreeClassifier(),
+    'RandomForestClassifier': lambda: RandomForestClassifier()
+}
+
+VECTORIZERS = {
+    'bow': lambda: CountVectorizer(),
+    'char-2-gram': lambda: CountVectorizer(analyzer='char_wb', ngram_range=(2, 2)),
+    'char-3-gram': lambda: CountVectorizer(analyzer='char_wb', ngram_range=(3, 3)),
+    'tfidf': lambda: TfidfVectorizer()
+}
+
+
+class ClassifierBundle:
+    """
+    ClassifierBundle holds everything that is needed to classify new lines like the lines of the training corpus: the
+    text preprocessing configuration, the level of classification, the mapping between classes and integer labels
+    and the fitted pipeline of vectorizer and classifier. Bundles are saved and loaded with joblib.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, pipeline, level_of_classification: LevelOfClassification, label_unrelated: str,
+                 dictionary_for_integer_labels: dict, preprocessing_flags: dict):
+        """
+        Create a bundle from a fitted pipeline.
+        :param pipeline: Fitted sklearn.pipeline.Pipeline of vectorizer and classifier, which predicts integer labels.
+        :param level_of_classification: Level of classification the pipeline was trained on.
+        :param label_unrelated: Label for all items that do not fit any class on the level of classification.
+        :param dictionary_for_integer_labels: Matching between the classes and the integer labels of the pipeline.
+        :param preprocessing_flags: Keyword arguments for TextPreprocessor.preprocess_batch which were used for the
+                training data.
+        """
+        self.pipeline = pipeline
+        self.level_of_classification = level_of_classification
+        self.label_unrelated = label_unrelated
+        self.dictionary_for_integer_labels = dict(dictionary_for_integer_labels)
+        self.preprocessing_flags = dict(preprocessing_flags)
+        self.__class_names = dict((integer_label, category)
+                                  for category, integer_label in dictionary_for_integer_labels.items())
+        self.__label_mappings = dict()
+
+    def save(self, bundle_file: str):
+        """
+        Save the bundle. The file is replaced atomically.
+        :param bundle_file: Path to the file.
+        """
+        content = {'format_version': self.FORMAT_VERSION, 'pipeline': self.pipeline,
+                   'level_of_classification': self.level_of_classification.name,
+                   'label_unrelated': self.label_unrelated,
+                   'dictionary_for_integer_labels': self.dictionary_for_integer_labels,
+                   'preprocessing_flags': self.preprocessing_flags}
+        joblib.dump(content, bundle_file + '.tmp')
+        os.replace(bundle_file + '.tmp', bundle_file)
+
+    @staticmethod
+    def load(bundle_file: str):
+        """
+        Load a bundle saved with save(). Only load files from trusted sources, as they are unpickled.
+        :param bundle_file: Path to the file.
+        :return: ClassifierBundle
+        :raises ValueError: If the file was saved in another format version.
+        """
+        content = joblib.load(bundle_file)
+        if content.get('format_version') != ClassifierBundle.FORMAT_VERSION:
+            raise ValueError("Unsupported bundle format version: " + str(content.get('format_version')))
+        return ClassifierBundle(content['pipeline'], LevelOfClassification[content['level_of_classification']],
+                                content['label_unrelated'], content['dictionary_for_integer_labels'],
+                                content['preprocessing_flags'])
+
+    def predict(self, preprocessed_lines, level_of_classification=None):
+        """
+        Classify lines which were already preprocessed with the flags of the bundle.
+        :param preprocessed_lines: Iterable of preprocessed lines.
+        :param level_of_classification: Level of classification for the predictions, which must not be more
+                fine-grained than the level of the bundle. If None, the level of the bundle is used.
+        :return: List with the predicted class for each line.
+        """
+        labels = [self.__class_names[integer_label]
+                  for integer_label in self.pipeline.predict(np.asarray(preprocessed_lines, dtype=object))]
+        if level_of_classification is None or level_of_classification == self.level_of_classification:
+            return labels
+        label_mapping = self.get_label_mapping(level_of_classification)
+        return [label_mapping[label] for label in labels]
+
+    def get_label_mapping(self, level_of_classification: LevelOfClassification):
+        """
+        Returns the mapping from the classes of the bundle to their classes on another 'level_of_classification'.
+        :param level_of_classification: Target level of classification.
+        :return: Dictionary which maps each class of the bundle (and 'label_unrelated') to a class on the target level.
+        :raises ValueError: If the target level is more fine-grained than the level of the bundle.
+        """
+        label_mapping = self.__label_mappings.get(level_of_classification)
+        if label_mapping is None:
+            label_preprocessor = LabelPreprocessor()
+            dictionary_for_level = label_preprocessor.generate_dictionary_for_integer_labels(
+                level_of_classification.value, self.label_unrelated)
+            integer_label_mapping = label_preprocessor.generate_integer_label_mapping(
+                ClassificationSchemeBuilder().build_compiled_classification_scheme(),
+                self.dictionary_for_integer_labels, level_of_classification, dictionary_for_level,
+                self.label_unrelated)
+            class_names_on_level = dict((integer_label, category)
+                                        for category, integer_label in dictionary_for_level.items())
+            label_mapping = {category: class_names_on_level[integer_label_mapping[integer_label]]
+                             for category, integer_label in self.dictionary_for_integer_labels.items()}
+            self.__label_mappings[level_of_classification] = label_mapping
+        return label_mapping
+
+
+def train_bundle(root_folder: str, vectorizer, classifier, level_of_classification: LevelOfClassification,
+                 label_unrelated: str, preprocessing_flags: dict, text_preprocessor: TextPreprocessor,
+                 filter_out_non_design_decisions=False, n_jobs=1):
+    """
+    Train a pipeline of vectorizer and classifier on the complete corpus in 'root_folder' in the same way as the
+    notebook prepares the data for the cross-validation.
+    :param root_folder: Folder with the corpus (txt and csv files).
+    :param vectorizer: Vectorizer (sklearn transformer), a copy of it is fitted.
+    :param classifier: Classifier (sklearn estimator), a copy of it is fitted.
+    :param level_of_classification: Level of classification the labels are unified to.
+    :param label_unrelated: Label for all items that do not fit any class on the level of classification.
+    :param preprocessing_flags: Keyword arguments for TextPreprocessor.preprocess_batch, e.g. do_lowercasing.
+    :param text_preprocessor: Preprocessor for the lines of the corpus.
+    :param filter_out_non_design_decisions: if set to true, lines without design decision are not used for training
+    :param n_jobs: number of processes for the text preprocessing
+    :return: ClassifierBundle with the fitted pipeline.
+    """
+    corpus = CorpusLoader().generate_data_frame(root_folder)
+    if filter_out_non_design_decisions:
+        corpus = corpus[corpus['design_decision'] != 0]
+    corpus = corpus.assign(line=text_preprocessor.preprocess_batch(corpus['line'], n_jobs=n_jobs,
+                                                                   **preprocessing_flags))
+
+    label_preprocessor = LabelPreprocessor()
+    corpus = label_preprocessor.transform_df_unified_labels(
+        corpus, 'classification', ClassificationSchemeBuilder().build_compiled_classification_scheme(),
+        level_of_classification, label_unrelated)
+    dictionary_for_integer_labels = label_preprocessor.generate_dictionary_for_integer_labels(
+        level_of_classification.value, label_unrelated)
+    labels = label_preprocessor.encode_integer_labels(corpus, 'classification', dictionary_for_integer_labels)
+
+    pipeline = make_pipeline(clone(vectorizer), clone(classifier))
+    pipeline.fit(np.asarray(corpus['line'], dtype=object), labels)
+    return ClassifierBundle(pipeline, level_of_classification, label_unrelated, dictionary_for_integer_labels,
+                            preprocessing_flags)
+
+
+class InferenceService:
+    """
+    InferenceService classifies streams of lines with a ClassifierBundle. Lines submitted by concurrent clients are
+    collected in batches, which are preprocessed and classified together. A batch is started as soon as it is full or
+    its first line waited 'max_latency' seconds, so the latency of a line is bounded by 'max_latency' plus the time for
+    classifying one batch. The service counts the classified lines and batches and keeps the latencies of the recent
+    lines to report throughput and latency (see get_statistics()).
+    """
+    def __init__(self, bundle: ClassifierBundle, text_preprocessor: TextPreprocessor, level_of_classification=None,
+                 max_batch_size=64, max_latency=0.05, latency_window=10000):
+        """
+        Create a service. Call start() before submitting lines.
+        :param bundle: Bundle with the fitted pipeline.
+        :param text_preprocessor: Preprocessor for the submitted lines.
+        :param level_of_classification: Level of classification of the predictions, the level of the bundle if None.
+        :param max_batch_size: Maximum number of lines classified together.
+        :param max_latency: Maximum time in seconds a line waits for further lines before its batch is started.
+        :param latency_window: Number of recent lines whose latencies are used for the statistics.
+        """
+        self.bundle = bundle
+        self.text_preprocessor = text_preprocessor
+        self.level_of_classification = level_of_classification or bundle.level_of_classification
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        # Fail at startup if the predictions cannot be mapped to the selected level.
+        if self.level_of_classification != bundle.level_of_classification:
+            bundle.get_label_mapping(self.level_of_classification)
+        self.__condition = threading.Condition()
+        self.__pending = deque()
+        self.__worker = None
+        self.__stopped = False
+        self.__started_at = None
+        self.__classified_lines = 0
+        self.__batches = 0
+        self.__failed_batches = 0
+        self.__busy_seconds = 0.0
+        self.__latencies = deque(maxlen=latency_window)
+
+    def start(self):
+        """
+        Start the thread which classifies the batches.
+        """
+        with self.__condition:
+            if self.__worker is not None:
+                return
+            self.__stopped = False
+            self.__started_at = time.monotonic()
+            self.__worker = threading.Thread(target=self.__run_batches, name='InferenceService', daemon=True)
+            self.__worker.start()
+
+    def stop(self):
+        """
+        Classify all submitted lines and stop the thread which classifies the batches.
+        """
+        with self.__condition:
+            worker = self.__worker
+            self.__stopped = True
+            self.__condition.notify_all()
+        if worker is not None:
+            worker.join()
+        self.__worker = None
+
+    def submit(self, line: str):
+        """
+        Submit a line for classification.
+        :param line: Raw (not preprocessed) line.
+        :return: concurrent.futures.Future whose result is the predicted class.
+        :raises RuntimeError: If the service is not running.
+        """
+        future = Future()
+        with self.__condition:
+            if self.__worker is None or self.__stopped:
+                raise RuntimeError("InferenceService is not running")
+            self.__pending.append((line, future, time.monotonic()))
+            self.__condition.notify_all()
+        return future
+
+    def classify(self, lines):
+        """
+        Classify lines and wait for the predictions. The lines are batched together with lines of other clients.
+        :param lines: Iterable of raw lines.
+        :return: List with the predicted class for each line.
+        """
+        futures = [self.submit(line) for line in lines]
+        return [future.result() for future in futures]
+
+    def get_statistics(self):
+        """
+        Report throughput and latency of the service.
+        :return: Dictionary with the number of classified lines, batches and failed batches, the throughput in lines
+                 per second of uptime and of busy time, the mean batch size and percentiles of the latency in seconds
+                 over the recent lines.
+        """
+        with self.__condition:
+            latencies = np.array(self.__latencies, dtype=float)
+            classified_lines = self.__classified_lines
+            batches = self.__batches
+            failed_batches = self.__failed_batches
+            busy_seconds = self.__busy_seconds
+            pending_lines = len(self.__pending)
+        uptime = time.monotonic() - self.__started_at if self.__started_at is not None else 0.0
+        statistics = {'classified_lines': classified_lines, 'batches': batches, 'failed_batches': failed_batches,
+                      'pending_lines': pending_lines, 'uptime_seconds': uptime, 'busy_seconds': busy_seconds,
+                      'lines_per_second': classified_lines / uptime if uptime > 0 else None,
+                      'lines_per_busy_second': classified_lines / busy_seconds if busy_seconds > 0 else None,
+                      'mean_batch_size': classified_lines / batches if batches else None}
+        for name, percentile in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+            statistics['latency_' + name + '_seconds'] = (float(np.percentile(latencies, percentile))
+                                                          if len(latencies) else None)
+        statistics['latency_mean_seconds'] = float(latencies.mean()) if len(latencies) else None
+        return statistics
+
+    def serve_json_lines(self, input_stream=sys.stdin, output_stream=sys.stdout):
+        """
+        Classify lines read from a stream of JSON lines, e.g. '{"id": 1, "line": "The data is stored in MySQL."}', until
+        the stream ends. For each request a JSON line with its 'id' and the predicted 'label' (or an 'error') is written
+        in the order of the requests.
+        :param input_stream: Stream with one JSON object per line.
+        :param output_stream: Stream for the responses.
+        """
+        responses = Queue(maxsize=4 * self.max_batch_size)
+        writer = threading.Thread(target=self.__write_json_lines, args=(responses, output_stream), daemon=True)
+        writer.start()
+        try:
+            for request_line in input_stream:
+                if not request_line.strip():
+                    continue
+                request_id = None
+                try:
+                    request = json.loads(request_line)
+                    request_id = request.get('id')
+                    line = request['line']
+                    if not isinstance(line, str):
+                        raise TypeError("'line' must be a string")
+                    responses.put((request_id, self.submit(line)))
+                except (ValueError, KeyError, TypeError, AttributeError) as error:
+                    responses.put((request_id, error))
+        finally:
+            responses.put(None)
+            writer.join()
+
+    def serve_http(self, host='127.0.0.1', port=8000):
+        """
+        Serve the classification over HTTP until the process is interrupted. 'POST /classify' with the body
+        '{"lines": [...]}' returns '{"labels": [...]}', 'GET /statistics' returns get_statistics().
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+        server = ThreadingHTTPServer((host, port), _create_request_handler(self))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def __run_batches(self):
+        """
+        Collect submitted lines in batches and classify them until the service is stopped.
+        """
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__stopped:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                deadline = self.__pending[0][2] + self.max_latency
+                while len(self.__pending) < self.max_batch_size and not self.__stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__condition.wait(remaining)
+                batch = [self.__pending.popleft() for _ in range(min(self.max_batch_size, len(self.__pending)))]
+            self.__classify_batch(batch)
+
+    def __classify_batch(self, batch: list):
+        """
+        Preprocess and classify a batch and resolve the futures of its lines.
+        :param batch: List of tuples (line, future, time of submission).
+        """
+        start = time.monotonic()
+        try:
+            with instrumentation.stage('InferenceService.preprocess'):
+                preprocessed_lines = self.text_preprocessor.preprocess_batch(
+                    [line for line, _, _ in batch], **self.bundle.preprocessing_flags)
+            with instrumentation.stage('InferenceService.predict'):
+                labels = self.bundle.predict(preprocessed_lines, self.level_of_classification)
+        except Exception as error:
+            with self.__condition:
+                self.__failed_batches += 1
+            for _, future, _ in batch:
+                future.set_exception(error)
+            return
+        end = time.monotonic()
+        with self.__condition:
+            self.__classified_lines += len(batch)
+            self.__batches += 1
+            self.__busy_seconds += end - start
+            self.__latencies.extend(end - submitted_at for _, _, submitted_at in batch)
+        for (_, future, _), label in zip(batch, labels):
+            future.set_result(label)
+
+    def __write_json_lines(self, responses: Queue, output_stream):
+        """
+        Write the responses of serve_json_lines() in the order of the requests.
+        :param responses: Queue of tuples (request id, future or error), None marks the end.
+        :param output_stream: Stream for the responses.
+        """
+        while True:
+            response = responses.get()
+            if response is None:
+                return
+            request_id, result = response
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                output = {'id': request_id, 'label': result.result()}
+            except Exception as error:
+                output = {'id': request_id, 'error': str(error)}
+            output_stream.write(json.dumps(output) + '\n')
+            output_stream.flush()
+
+
+def _create_request_handler(service: InferenceService):
+    """
+    Create the HTTP request handler class for 'service'.
+    :param service: Running InferenceService.
+    :return: Subclass of http.server.BaseHTTPRequestHandler.
+    """
+    class RequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/statistics':
+                self.__send_json(200, service.get_statistics())
+            else:
+                self.__send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/classify':
+                self.__send_json(404, {'error': 'not found'})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                lines = request['lines']
+                if not isinstance(lines, list) or not all(isinstance(line, str) for line in lines):
+                    raise TypeError("'lines' must be a list of strings")
+            except (ValueError, KeyError, TypeError) as error:
+                self.__send_json(400, {'error': str(error)})
+                return
+            try:
+                self.__send_json(200, {'labels': service.classify(lines)})
+            except Exception as error:
+                self.__send_json(500, {'error': str(error)})
+
+        def log_message(self, format, *args):
+            pass
+
+        def __send_json(self, status: int, content: dict):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return RequestHandler
+
+
+def main(arguments=None):
+    """
+    Command line interface, e.g. 'python inference_service.py train --output model.joblib' to train a bundle on the
+    corpus and 'python inference_service.py serve model.joblib --http 8000' to serve it.
+    :param arguments: List of command line arguments, sys.argv is used if None.
+    """
+    parser = argparse.ArgumentParser(description='Train and serve classifiers for design decisions.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='train a bundle on the complete corpus')
+    train_parser.add_argument('--root-folder', default=os.path.join(os.path.dirname(__file__), '..', 'dataset'),
+                              help='folder with the corpus (txt and csv files)')
+    train_parser.add_argument('--output', required=True, help='file for the bundle')
+    train_parser.add_argument('--classifier', choices=sorted(CLASSIFIERS), default='LogisticRegression')
+    train_parser.add_argument('--vectorizer', choices=sorted(VECTORIZERS), default='tfidf')
+    train_parser.add_argument('--level', choices=[level.name for level in LevelOfClassification], default='LEAVES',
+                              help='level of classification of the labels')
+    train_parser.add_argument('--label-unrelated', default='none of these')
+    train_parser.add_argument('--do-cleanup', action='store_true')
+    train_parser.add_argument('--do-lowercasing', action='store_true')
+    train_parser.add_argument('--do-stop-word-removal', action='store_true')
+    train_parser.add_argument('--do-lemmatization', action='store_true')
+    train_parser.add_argument('--filter-out-non-design-decisions', action='store_true',
+                              help='train only on lines with a design decision')
+    train_parser.add_argument('--n-jobs', type=int, default=1, help='number of processes for text preprocessing')
+
+    serve_parser = subparsers.add_parser('serve', help='classify lines with a bundle')
+    serve_parser.add_argument('bundle', help='file of the bundle')
+    serve_parser.add_argument('--level', choices=[level.name for level in LevelOfClassification],
+                              help='level of classification of the predictions, the level of the bundle by default')
+    serve_parser.add_argument('--http', type=int, metavar='PORT',
+                              help='serve over HTTP on this port instead of JSON lines on stdin/stdout')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='address for HTTP')
+    serve_parser.add_argument('--max-batch-size', type=int, default=64)
+    serve_parser.add_argument('--max-latency', type=float, default=0.05,
+                              help='seconds a line waits for further lines before its batch is classified')
+
+    for subparser in (train_parser, serve_parser):
+        subparser.add_argument('--download-resources', action='store_true', help='download the NLTK resources first')
+    arguments = parser.parse_args(arguments)
+
+    text_preprocessor = TextPreprocessor(download_resources=arguments.download_resources)
+    if arguments.command == 'train':
+        preprocessing_flags = dict(do_cleanup=arguments.do_cleanup, do_lowercasing=arguments.do_lowercasing,
+                                   do_stop_word_removal=arguments.do_stop_word_removal,
+                                   do_lemmatization=arguments.do_lemmatization)
+        bundle = train_bundle(arguments.root_folder, VECTORIZERS[arguments.vectorizer](),
+                              CLASSIFIERS[arguments.classifier](), LevelOfClassification[arguments.level],
+                              arguments.label_unrelated, preprocessing_flags, text_preprocessor,
+                              arguments.filter_out_non_design_decisions, arguments.n_jobs)
+        bundle.save(arguments.output)
+        return
+
+    bundle = ClassifierBundle.load(arguments.bundle)
+    level_of_classification = LevelOfClassification[arguments.level] if arguments.level else None
+    if level_of_classification not in (None, bundle.level_of_classification):
+        try:
+            bundle.get_label_mapping(level_of_classification)
+        except ValueError as error:
+            serve_parser.error("the bundle was trained on level " + bundle.level_of_classification.name
+                               + " and cannot predict level " + level_of_classification.name + ": " + str(error))
+    service = InferenceService(bundle, text_preprocessor, level_of_classification,
+                               max_batch_size=arguments.max_batch_size, max_latency=arguments.max_latency)
+    service.start()
+    try:
+        if arguments.http is not None:
+            service.serve_http(arguments.host, arguments.http)
+        else:
+            service.serve_json_lines()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        print(json.dumps(service.get_statistics()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
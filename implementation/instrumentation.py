@@ -0,0 +1,269 @@
+import cProfile
+import functools
+import os
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from prettytable import PrettyTable
+
+
+class Instrumentation:
+    """
+    Instrumentation collects runtimes and memory usage of the stages of the classification process and counts
+    expensive events, e.g. loading NLTK resources or traversing the classification scheme. It is disabled by default;
+    then stages and events are not recorded and only a flag is checked. Use the module-level instance
+    'instrumentation' together with the decorator 'instrumented'.
+    """
+    def __init__(self):
+        """
+        Create a disabled instrumentation without any records.
+        """
+        self.enabled = False
+        self.track_memory = False
+        self.profile_file = None
+        self.__owner_process = None
+        self.__profiler = None
+        self.__started_tracemalloc = False
+        self.__stages = dict()
+        self.__counters = Counter()
+        self.__memory_snapshots = []
+
+    def enable(self, track_memory=False, profile_file=None):
+        """
+        Start recording stages and events.
+        :param track_memory: if set to true, the memory allocated by Python is traced with tracemalloc (slow)
+        :param profile_file: if given, the calls in this process are profiled with cProfile and the statistics are
+                written to this file by disable()
+        """
+        self.enabled = True
+        self.track_memory = track_memory
+        self.profile_file = profile_file
+        self.__owner_process = os.getpid()
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracemalloc = True
+        if profile_file is not None:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def disable(self):
+        """
+        Stop recording. The records are kept until reset() is called.
+        """
+        self.enabled = False
+        if self.__profiler is not None:
+            self.__profiler.disable()
+            self.__profiler.dump_stats(self.profile_file)
+            self.__profiler = None
+        if self.__started_tracemalloc:
+            tracemalloc.stop()
+            self.__started_tracemalloc = False
+
+    def is_enabled_in_this_process(self):
+        """
+        Check whether the instrumentation was enabled in the current process. Forked worker processes inherit the
+        state of the main process, but their records would never reach it.
+        :return: True if enabled by this process.
+        """
+        return self.enabled and self.__owner_process == os.getpid()
+
+    def begin_worker_recording(self):
+        """
+        Start recording in a worker process with empty records. Profiling and memory tracking which were possibly
+        inherited from the main process are stopped without writing any results.
+        """
+        if self.__profiler is not None:
+            self.__profiler.disable()
+            self.__profiler = None
+        self.__started_tracemalloc = False
+        self.reset()
+        self.enabled = True
+        self.track_memory = False
+        self.profile_file = None
+        self.__owner_process = os.getpid()
+
+    def end_worker_recording(self):
+        """
+        Stop recording in a worker process.
+        :return: Exported records, which should be merged by the main process.
+        """
+        records = self.export()
+        self.enabled = False
+        self.reset()
+        return records
+
+    def reset(self):
+        """
+        Delete all records.
+        """
+        self.__stages.clear()
+        self.__counters.clear()
+        self.__memory_snapshots.clear()
+
+    def count(self, event: str, amount=1):
+        """
+        Count an event if the instrumentation is enabled.
+        :param event: Name of the event.
+        :param amount: Number of occurrences.
+        """
+        if self.enabled:
+            self.__counters[event] += amount
+
+    def stage(self, name: str):
+        """
+        Context manager which records the runtime (and memory if tracked) of the enclosed code as one call of the stage
+        'name'. If the instrumentation is disabled, nothing is recorded.
+        :param name: Name of the stage.
+        :return: Context manager.
+        """
+        if not self.enabled:
+            return nullcontext()
+        return _StageTimer(self, name)
+
+    def snapshot_memory(self, label: str):
+        """
+        Save the current and peak memory allocated by Python under 'label'. Memory must be tracked, see enable().
+        :param label: Name of the snapshot.
+        """
+        if self.enabled and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.__memory_snapshots.append({'label': label, 'current_bytes': current, 'peak_bytes': peak})
+
+    def record_stage(self, name: str, seconds: float, memory_bytes=None):
+        """
+        Add one call of a stage to the records.
+        :param name: Name of the stage.
+        :param seconds: Runtime of the call.
+        :param memory_bytes: Change of the allocated memory during the call or None if it is not tracked.
+        """
+        record = self.__stages.setdefault(name, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                 'max_memory_bytes': None})
+        record['calls'] += 1
+        record['total_seconds'] += seconds
+        record['max_seconds'] = max(record['max_seconds'], seconds)
+        if memory_bytes is not None:
+            record['max_memory_bytes'] = max(record['max_memory_bytes'] or 0, memory_bytes)
+
+    def export(self):
+        """
+        Export all records, e.g. to send them from a worker process to the main process.
+        :return: Dictionary with the records of stages, counters and memory snapshots.
+        """
+        return {'stages': {name: dict(record) for name, record in self.__stages.items()},
+                'counters': dict(self.__counters),
+                'memory_snapshots': list(self.__memory_snapshots)}
+
+    def merge(self, records: dict):
+        """
+        Add records exported by another instrumentation (see export()) to the records of this one.
+        :param records: Exported records or None.
+        """
+        if records is None:
+            return
+        for name, other in records['stages'].items():
+            record = self.__stages.setdefault(name, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                                     'max_memory_bytes': None})
+            record['calls'] += other['calls']
+            record['total_seconds'] += other['total_seconds']
+            record['max_seconds'] = max(record['max_seconds'], other['max_seconds'])
+            if other['max_memory_bytes'] is not None:
+                record['max_memory_bytes'] = max(record['max_memory_bytes'] or 0, other['max_memory_bytes'])
+        self.__counters.update(records['counters'])
+        self.__memory_snapshots.extend(records['memory_snapshots'])
+
+    def summary(self):
+        """
+        Summarize the records per stage.
+        :return: Dictionary with the records (see export()), where every stage additionally has 'mean_seconds'.
+        """
+        summary = self.export()
+        for record in summary['stages'].values():
+            record['mean_seconds'] = record['total_seconds'] / record['calls']
+        return summary
+
+    def present_summary(self, decimal_places=4):
+        """
+        Present the records of stages and counters in tables.
+        :param decimal_places: Number of digits behind comma for the runtimes.
+        :return: Tuple of two prettytable.PrettyTable (stages, counters).
+        """
+        summary = self.summary()
+        stage_table = PrettyTable()
+        stage_table.field_names = ['Stage', 'Calls', 'Total (s)', 'Mean (s)', 'Max (s)', 'Max memory (bytes)']
+        for name, record in sorted(summary['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+            stage_table.add_row([name, record['calls'], round(record['total_seconds'], decimal_places),
+                                 round(record['mean_seconds'], decimal_places),
+                                 round(record['max_seconds'], decimal_places),
+                                 '-' if record['max_memory_bytes'] is None else record['max_memory_bytes']])
+        counter_table = PrettyTable()
+        counter_table.field_names = ['Event', 'Count']
+        for event, count in sorted(summary['counters'].items()):
+            counter_table.add_row([event, count])
+        return stage_table, counter_table
+
+
+class _StageTimer:
+    """
+    Context manager used by Instrumentation.stage() to measure one call of a stage.
+    """
+    def __init__(self, owner: Instrumentation, name: str):
+        self.owner = owner
+        self.name = name
+        self.start = None
+        self.start_memory = None
+
+    def __enter__(self):
+        if self.owner.track_memory and tracemalloc.is_tracing():
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        memory_bytes = None
+        if self.start_memory is not None and tracemalloc.is_tracing():
+            memory_bytes = tracemalloc.get_traced_memory()[0] - self.start_memory
+        self.owner.record_stage(self.name, seconds, memory_bytes)
+        return False
+
+
+instrumentation = Instrumentation()
+
+
+def instrumented(stage_name: str):
+    """
+    Decorator which records every call of the decorated function as stage 'stage_name' of the module-level
+    instrumentation. While the instrumentation is disabled, the function is called directly.
+    :param stage_name: Name of the stage.
+    :return: Decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+            with _StageTimer(instrumentation, stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_in_worker(instrumentation_enabled: bool, function, *args):
+    """
+    Run 'function' in a worker process and collect the records of the instrumentation there, so that the main process
+    can merge them. If the worker is the main process itself (e.g. sequential execution), the records are written
+    directly and nothing is returned.
+    :param instrumentation_enabled: Whether the instrumentation is enabled in the main process.
+    :param function: Function to run.
+    :param args: Arguments for the function.
+    :return: Tuple (return value of the function, exported records or None).
+    """
+    if not instrumentation_enabled or instrumentation.is_enabled_in_this_process():
+        return function(*args), None
+    instrumentation.begin_worker_recording()
+    try:
+        return_value = function(*args)
+    finally:
+        records = instrumentation.end_worker_recording()
+    return return_value, records
@@ -0,0 +1,19 @@
+from annotation_agreement import AnnotationAgreement
+from SAD_classification_dataframe_operations import LevelOfClassification
+
+
+def write_annotation(folder, rows):
+    folder.mkdir()
+    (folder / 'Document.csv').write_text('sentence_number;design_decision;classification;alternative_classification\n' +
+                                         ''.join(';'.join(row) + ';-\n' for row in rows))
+
+
+def test_older_taxonomy_labels_are_design_decisions_on_level_0(tmp_path):
+    write_annotation(tmp_path / 'annotator1', [('1', '1', 'method'), ('2', '1', 'library'), ('3', '0', '-')])
+    write_annotation(tmp_path / 'annotator2', [('1', '1', 'function'), ('2', '1', 'framework'), ('3', '0', '-')])
+    annotation_agreement = AnnotationAgreement(str(tmp_path))
+    _, _, level_ratings = annotation_agreement.align_document(annotation_agreement.find_documents()[0],
+                                                              [LevelOfClassification.LEVEL_0,
+                                                               LevelOfClassification.LEAVES])
+    assert level_ratings['LEVEL_0'].tolist() == [['design decision'] * 2] * 2 + [['none of these'] * 2]
+    assert level_ratings['LEAVES'][:, 0].tolist() == ['none of these'] * 3
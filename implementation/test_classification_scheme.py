@@ -0,0 +1,48 @@
+import copy
+import pickle
+import numpy as np
+import pytest
+from anytree import Node, PreOrderIter
+from classification_scheme import ClassificationSchemeBuilder, CompiledClassificationScheme
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification
+
+
+def assert_equal_schemes(compiled_scheme, other_compiled_scheme):
+    assert compiled_scheme.names == other_compiled_scheme.names
+    assert dict(compiled_scheme.name_to_id) == dict(other_compiled_scheme.name_to_id)
+    for attribute in ('parents', 'depths', 'subtree_ends', 'ancestors'):
+        np.testing.assert_array_equal(getattr(compiled_scheme, attribute), getattr(other_compiled_scheme, attribute))
+
+
+def test_compiled_scheme_matches_tree():
+    classification_scheme = ClassificationSchemeBuilder().build_classification_scheme()
+    compiled_scheme = CompiledClassificationScheme(classification_scheme)
+    nodes = list(PreOrderIter(classification_scheme))
+    assert compiled_scheme.names == tuple(node.name for node in nodes)
+    for node in nodes:
+        node_id = compiled_scheme.get_id(node.name)
+        assert compiled_scheme.depths[node_id] == node.depth
+        for other_node in nodes:
+            assert compiled_scheme.is_descendant(compiled_scheme.get_id(other_node.name), node_id) == \
+                (other_node is node or node in other_node.ancestors)
+    assert_equal_schemes(CompiledClassificationScheme(compiled_scheme.to_tree()), compiled_scheme)
+
+
+def test_compiled_scheme_can_be_pickled_and_copied():
+    compiled_scheme = ClassificationSchemeBuilder().build_compiled_classification_scheme()
+    assert_equal_schemes(pickle.loads(pickle.dumps(compiled_scheme)), compiled_scheme)
+    assert_equal_schemes(copy.deepcopy(compiled_scheme), compiled_scheme)
+
+    label_preprocessor = LabelPreprocessor()
+    label_index = label_preprocessor.get_label_index(compiled_scheme, LevelOfClassification.LEVEL_1, 'none of these')
+    unpickled_label_preprocessor = pickle.loads(pickle.dumps(label_preprocessor))
+    assert unpickled_label_preprocessor.get_label_index(compiled_scheme, LevelOfClassification.LEVEL_1,
+                                                        'none of these') == label_index
+
+
+def test_compiled_scheme_rejects_duplicate_names():
+    root = Node('design decision')
+    Node('tool', parent=Node('technological', parent=root))
+    Node('tool', parent=root)
+    with pytest.raises(ValueError):
+        CompiledClassificationScheme(root)
@@ -0,0 +1,42 @@
+import pickle
+from unittest import mock
+import numpy as np
+from sklearn.base import clone
+from embedding_cache import EmbeddingVectorizer, SentenceEmbeddingCache
+
+HIDDEN_SIZE = 4
+
+
+def encode_stub(self, lines):
+    """
+    Deterministic embeddings which stand in for the encoder, so that the tests need neither torch nor a model.
+    """
+    return np.array([[len(line) + column for column in range(HIDDEN_SIZE)] for line in lines], dtype=np.float32)
+
+
+def test_lines_are_encoded_once(tmp_path):
+    with mock.patch.object(SentenceEmbeddingCache, '_SentenceEmbeddingCache__encode', autospec=True,
+                           side_effect=encode_stub) as encode:
+        vectorizer = EmbeddingVectorizer(cache_folder=str(tmp_path))
+        embeddings = vectorizer.fit_transform(['use a cache', 'a', 'use a cache'])
+        np.testing.assert_array_equal(embeddings, encode_stub(None, ['use a cache', 'a', 'use a cache']))
+        assert encode.call_args_list[0].args[1] == ['use a cache', 'a']
+
+        # a new cache instance only encodes the missing line
+        embeddings = SentenceEmbeddingCache(str(tmp_path)).get_embeddings(['a', 'new line'])
+        np.testing.assert_array_equal(embeddings, encode_stub(None, ['a', 'new line']))
+        assert encode.call_count == 2 and encode.call_args_list[1].args[1] == ['new line']
+
+        assert vectorizer.transform([]).shape == (0, HIDDEN_SIZE)
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(vectorizer)).transform(['a']), encode_stub(None, ['a']))
+        assert encode.call_count == 2
+
+
+def test_vectorizer_keeps_its_cache(tmp_path):
+    vectorizer = EmbeddingVectorizer(cache_folder=str(tmp_path))
+    with mock.patch.object(SentenceEmbeddingCache, '_SentenceEmbeddingCache__encode', autospec=True,
+                           side_effect=encode_stub) as encode:
+        vectorizer.transform(['a'])
+        vectorizer.transform(['b'])
+    assert {call.args[0] for call in encode.call_args_list} == {encode.call_args_list[0].args[0]}
+    assert clone(vectorizer).get_params() == vectorizer.get_params() == EmbeddingVectorizer(str(tmp_path)).get_params()
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, make_scorer
+from sklearn.model_selection import RepeatedKFold, cross_validate
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import make_pipeline
+from evaluation_engine import EvaluationEngine
+
+WORDS = ['component', 'interface', 'database', 'framework', 'class', 'test', 'deploy', 'service', 'api', 'tool']
+SCORING = {'accuracy': make_scorer(accuracy_score),
+           'f1_score': make_scorer(f1_score, average='weighted', zero_division=0)}
+
+
+def generate_corpus(number_of_lines=90, seed=0):
+    """
+    Random lines whose label depends on the words they contain.
+    """
+    random_state = np.random.RandomState(seed)
+    lines = np.array([' '.join(random_state.choice(WORDS, 6)) for _ in range(number_of_lines)], dtype=object)
+    labels = np.array([('database' in line) + 2 * ('api' in line and 'database' not in line) for line in lines])
+    return lines, labels
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_scores_equal_pipeline_cross_validation(n_jobs, tmp_path):
+    lines, labels = generate_corpus()
+    classifiers = [MultinomialNB(), LogisticRegression(max_iter=1000)]
+    vectorizers = [CountVectorizer(ngram_range=(1, 1)), TfidfVectorizer(ngram_range=(1, 2))]
+    cv = RepeatedKFold(n_splits=3, n_repeats=2, random_state=1)
+    evaluation_engine = EvaluationEngine(classifiers, vectorizers, SCORING, cv, n_jobs=n_jobs,
+                                         feature_cache_folder=str(tmp_path / 'features'))
+    scores = evaluation_engine.evaluate(lines, labels)
+
+    for i, classifier in enumerate(classifiers):
+        for j, vectorizer in enumerate(vectorizers):
+            expected = cross_validate(make_pipeline(vectorizer, classifier), lines, labels, scoring=SCORING, cv=cv)
+            for metric in SCORING:
+                assert scores[metric][i, j] == expected['test_' + metric].mean()
+
+
+def test_hierarchical_scores_use_level_scoring():
+    lines, labels = generate_corpus()
+    label_mapping = np.array([0, 1, 1])
+    binary_scoring = {'f1_score': make_scorer(f1_score, average='binary')}
+    classifier, vectorizer = LogisticRegression(max_iter=1000), CountVectorizer()
+    cv = RepeatedKFold(n_splits=3, n_repeats=1, random_state=1)
+    evaluation_engine = EvaluationEngine([classifier], [vectorizer], SCORING, cv)
+    scores = evaluation_engine.evaluate_hierarchical(lines, labels, {'binary': label_mapping[labels]},
+                                                     {'binary': label_mapping},
+                                                     level_scoring={'binary': binary_scoring})
+
+    assert list(scores['binary']) == ['f1_score']
+    expected = []
+    for train_index, test_index in cv.split(lines, labels):
+        pipeline = make_pipeline(vectorizer, classifier).fit(lines[train_index], labels[train_index])
+        expected.append(f1_score(label_mapping[labels[test_index]], label_mapping[pipeline.predict(lines[test_index])]))
+    assert scores['binary']['f1_score'][0, 0] == pytest.approx(np.mean(expected))
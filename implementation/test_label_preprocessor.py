@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from anytree import Node, PreOrderIter, find_by_attr
+from sklearn.preprocessing import MultiLabelBinarizer
+from classification_scheme import ClassificationSchemeBuilder
+from corpus_loader import CorpusLoader
+from SAD_classification_dataframe_operations import LabelPreprocessor, LevelOfClassification
+
+DATASET_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+LABEL_UNRELATED = 'none of these'
+
+
+def transform_unified_labels_row_wise(df: pd.DataFrame, column_name: str, classification_scheme: Node,
+                                      level_of_classification: LevelOfClassification, label_unrelated: str):
+    """
+    Row-wise reference for LabelPreprocessor.transform_df_unified_labels: every label is replaced by the first class
+    of 'level_of_classification' which is the label itself or one of its parents (found with anytree.find_by_attr and
+    a breadth-first search), otherwise by 'label_unrelated'.
+    """
+    df_transformed = df.copy()
+    df_transformed[column_name] = df_transformed[column_name].astype(object)
+    for index, row in df_transformed.iterrows():
+        adjusted_label = label_unrelated
+        for selected_class in level_of_classification.value:
+            node = find_by_attr(classification_scheme, selected_class)
+            descendants, queue = [], list(node.children)
+            while queue:
+                current = queue.pop(0)
+                descendants.append(current.name)
+                queue.extend(current.children)
+            if row[column_name] == node.name or row[column_name] in descendants:
+                adjusted_label = node.name
+                break
+        df_transformed.at[index, column_name] = adjusted_label
+    return df_transformed
+
+
+def transform_integer_labels_row_wise(df: pd.DataFrame, column_name: str, dictionary_for_integer_labels: dict):
+    """
+    Row-wise reference for LabelPreprocessor.transform_df_integer_labels: every label with a mapping in
+    'dictionary_for_integer_labels' is replaced, all other values are kept.
+    """
+    df_with_integer_values = df.copy()
+    df_with_integer_values[column_name] = df_with_integer_values[column_name].astype(object)
+    for index, row in df_with_integer_values.iterrows():
+        for label in dictionary_for_integer_labels:
+            if row[column_name] == label:
+                df_with_integer_values.at[index, column_name] = dictionary_for_integer_labels.get(label)
+    return df_with_integer_values
+
+
+def transform_multi_label_row_wise(df: pd.DataFrame, first_column_name: str, second_column_name: str,
+                                   value_unrelated=0):
+    """
+    Row-wise reference for LabelPreprocessor.transform_df_multi_label, returns the list of multi labels.
+    """
+    multi_labels = []
+    for index, row in df.iterrows():
+        multi_label = [row[first_column_name]]
+        if row[second_column_name] != value_unrelated and row[second_column_name] != row[first_column_name]:
+            multi_label.append(row[second_column_name])
+        multi_labels.append(multi_label)
+    return multi_labels
+
+
+def build_inline_corpus(level_of_classification: LevelOfClassification):
+    """
+    Small corpus with labels from all parts of the classification scheme, unified to 'level_of_classification'.
+    """
+    corpus = pd.DataFrame({
+        'line': ['line ' + str(index) for index in range(8)],
+        'classification': ['class', 'tool', 'none of these', 'messaging', 'guideline', 'class', 'api',
+                           'architectural style'],
+        'alternative_classification': ['none of these', 'framework', 'none of these', 'messaging', 'tool',
+                                       'inheritance', 'none of these', 'none of these']})
+    label_preprocessor = LabelPreprocessor()
+    classification_scheme = ClassificationSchemeBuilder().build_classification_scheme()
+    for column_name in ('classification', 'alternative_classification'):
+        corpus = label_preprocessor.transform_df_unified_labels(corpus, column_name, classification_scheme,
+                                                                level_of_classification, LABEL_UNRELATED)
+    return corpus
+
+
+@pytest.mark.parametrize('level_of_classification', list(LevelOfClassification), ids=lambda level: level.name)
+@pytest.mark.parametrize('compiled', [False, True], ids=['tree', 'compiled'])
+def test_unified_labels(level_of_classification, compiled):
+    classification_scheme = ClassificationSchemeBuilder().build_classification_scheme()
+    labels = [node.name for node in PreOrderIter(classification_scheme)] + ['unknown', LABEL_UNRELATED, np.nan]
+    df = pd.DataFrame({'classification': labels})
+    expected = transform_unified_labels_row_wise(df, 'classification', classification_scheme, level_of_classification,
+                                                 LABEL_UNRELATED)
+    scheme = ClassificationSchemeBuilder().build_compiled_classification_scheme() if compiled else classification_scheme
+    label_preprocessor = LabelPreprocessor()
+    for _ in range(2):
+        transformed = label_preprocessor.transform_df_unified_labels(df, 'classification', scheme,
+                                                                     level_of_classification, LABEL_UNRELATED)
+        assert transformed['classification'].tolist() == expected['classification'].tolist()
+
+
+def test_label_index_follows_changes_of_the_scheme():
+    classification_scheme = ClassificationSchemeBuilder().build_classification_scheme()
+    label_preprocessor = LabelPreprocessor()
+    label_index = label_preprocessor.get_label_index(classification_scheme, LevelOfClassification.LEVEL_0,
+                                                     LABEL_UNRELATED)
+    assert label_preprocessor.get_label_index(ClassificationSchemeBuilder().build_classification_scheme(),
+                                              LevelOfClassification.LEVEL_0, LABEL_UNRELATED) is label_index
+    Node('new class', parent=find_by_attr(classification_scheme, 'tool'))
+    changed_label_index = label_preprocessor.get_label_index(classification_scheme, LevelOfClassification.LEVEL_0,
+                                                             LABEL_UNRELATED)
+    assert changed_label_index['new class'] == 'design decision'
+    assert 'new class' not in label_index
+
+
+def test_label_index_cache_is_bounded():
+    label_preprocessor = LabelPreprocessor()
+    for label_unrelated in range(LabelPreprocessor.LABEL_INDEX_CACHE_SIZE + 5):
+        label_preprocessor.get_label_index(ClassificationSchemeBuilder().build_classification_scheme(),
+                                           LevelOfClassification.LEAVES, str(label_unrelated))
+    assert len(label_preprocessor._LabelPreprocessor__label_indices) == LabelPreprocessor.LABEL_INDEX_CACHE_SIZE
+
+
+@pytest.fixture(params=[LevelOfClassification.LEVEL_0, LevelOfClassification.LEVEL_1, LevelOfClassification.LEAVES],
+                ids=lambda level: level.name)
+def corpus_and_dictionary(request):
+    corpus = build_inline_corpus(request.param)
+    dictionary_for_integer_labels = LabelPreprocessor().generate_dictionary_for_integer_labels(request.param.value,
+                                                                                               LABEL_UNRELATED)
+    return corpus, dictionary_for_integer_labels
+
+
+def test_integer_labels(corpus_and_dictionary):
+    corpus, dictionary_for_integer_labels = corpus_and_dictionary
+    label_preprocessor = LabelPreprocessor()
+    expected = transform_integer_labels_row_wise(corpus, 'classification', dictionary_for_integer_labels)
+    transformed = label_preprocessor.transform_df_integer_labels(corpus, 'classification',
+                                                                 dictionary_for_integer_labels)
+    assert transformed['classification'].tolist() == expected['classification'].tolist()
+    encoded = label_preprocessor.encode_integer_labels(corpus, 'classification', dictionary_for_integer_labels)
+    assert encoded.tolist() == expected['classification'].tolist()
+    assert encoded.dtype == np.uint8
+
+
+def test_multi_labels(corpus_and_dictionary):
+    corpus, dictionary_for_integer_labels = corpus_and_dictionary
+    label_preprocessor = LabelPreprocessor()
+    for column_name in ('classification', 'alternative_classification'):
+        corpus = label_preprocessor.transform_df_integer_labels(corpus, column_name, dictionary_for_integer_labels)
+    expected = transform_multi_label_row_wise(corpus, 'classification', 'alternative_classification')
+    transformed = label_preprocessor.transform_df_multi_label(corpus, 'classification', 'alternative_classification',
+                                                              'multi_label')
+    assert transformed['multi_label'].tolist() == expected
+
+    number_of_classes = len(dictionary_for_integer_labels)
+    binarized = MultiLabelBinarizer(classes=range(number_of_classes)).fit_transform(expected)
+    multi_hot = label_preprocessor.encode_multi_hot_labels(corpus, 'classification', 'alternative_classification',
+                                                           number_of_classes)
+    np.testing.assert_array_equal(multi_hot, binarized)
+    multi_hot = label_preprocessor.encode_multi_hot_labels(corpus, 'classification', 'alternative_classification',
+                                                           number_of_classes, use_sparse_matrix=True)
+    np.testing.assert_array_equal(multi_hot.toarray(), binarized)
+
+
+@pytest.mark.parametrize('categorical', [False, True], ids=['object', 'categorical'])
+def test_integer_labels_with_missing_and_unknown_labels(categorical):
+    dictionary_for_integer_labels = {LABEL_UNRELATED: 0, 'design decision': 1}
+    labels = pd.Series(['design decision', np.nan, 'unknown', LABEL_UNRELATED, 'design decision'])
+    df = pd.DataFrame({'classification': labels.astype('category') if categorical else labels})
+    label_preprocessor = LabelPreprocessor()
+
+    expected = transform_integer_labels_row_wise(df, 'classification', dictionary_for_integer_labels)
+    transformed = label_preprocessor.transform_df_integer_labels(df, 'classification', dictionary_for_integer_labels)
+    pd.testing.assert_series_equal(transformed['classification'].astype(object), expected['classification'])
+
+    with pytest.raises(ValueError):
+        label_preprocessor.encode_integer_labels(df, 'classification', dictionary_for_integer_labels)
+    known = df[df['classification'].isin(dictionary_for_integer_labels.keys())]
+    encoded = label_preprocessor.encode_integer_labels(known, 'classification', dictionary_for_integer_labels)
+    assert encoded.tolist() == [1, 0, 1]
+
+
+@pytest.mark.parametrize('categorical', [False, True], ids=['object', 'categorical'])
+def test_multi_labels_with_edge_cases(categorical):
+    df = pd.DataFrame({'first': [1, 2, 0, 3, 3], 'second': [0, 2, 4, 1, 0]})
+    if categorical:
+        df = df.astype('category')
+    label_preprocessor = LabelPreprocessor()
+
+    expected = transform_multi_label_row_wise(df, 'first', 'second')
+    transformed = label_preprocessor.transform_df_multi_label(df, 'first', 'second', 'multi_label')
+    assert transformed['multi_label'].tolist() == expected
+
+    binarized = MultiLabelBinarizer(classes=range(5)).fit_transform(expected)
+    multi_hot = label_preprocessor.encode_multi_hot_labels(df, 'first', 'second', 5)
+    np.testing.assert_array_equal(multi_hot, binarized)
+    empty = label_preprocessor.encode_multi_hot_labels(df.iloc[:0], 'first', 'second', 5, use_sparse_matrix=True)
+    assert empty.shape == (0, 5)
+
+
+def load_dataset(level_of_classification: LevelOfClassification):
+    """
+    Load the bundled dataset with both label columns unified to 'level_of_classification'.
+    """
+    label_preprocessor = LabelPreprocessor()
+    classification_scheme = ClassificationSchemeBuilder().build_compiled_classification_scheme()
+    corpus = CorpusLoader().generate_data_frame(DATASET_FOLDER)
+    for column_name in ('classification', 'alternative_classification'):
+        corpus = label_preprocessor.transform_df_unified_labels(corpus, column_name, classification_scheme,
+                                                                level_of_classification, LABEL_UNRELATED)
+    return corpus
+
+
+@pytest.fixture(scope='module', params=[LevelOfClassification.LEVEL_0, LevelOfClassification.LEAVES],
+                ids=lambda level: level.name)
+def dataset_and_dictionary(request):
+    corpus = load_dataset(request.param)
+    dictionary_for_integer_labels = LabelPreprocessor().generate_dictionary_for_integer_labels(request.param.value,
+                                                                                               LABEL_UNRELATED)
+    return corpus, dictionary_for_integer_labels
+
+
+def test_integer_labels_on_dataset(dataset_and_dictionary):
+    test_integer_labels(dataset_and_dictionary)
+
+
+def test_multi_labels_on_dataset(dataset_and_dictionary):
+    test_multi_labels(dataset_and_dictionary)
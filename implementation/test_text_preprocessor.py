@@ -0,0 +1,44 @@
+import nltk
+import pytest
+from SAD_classification_dataframe_operations import TextPreprocessor
+
+SENTENCES = ['The <b>Components</b> communicate via REST calls to http://example.com/api.',
+             'We decided to use PostgreSQL 12 as data base.',
+             '',
+             'Every service has its own repository and runs in a Docker container.',
+             'Tests are written with JUnit 5 and executed on every commit.'] * 7
+
+
+def nltk_resources_available(*resources):
+    """
+    Checks whether the NLTK resources are installed, as the tests do not download them.
+    """
+    try:
+        for resource in resources:
+            nltk.data.find(resource)
+    except LookupError:
+        return False
+    return True
+
+
+PREPROCESSING_FLAGS = [
+    dict(do_cleanup=True, do_lowercasing=True),
+    pytest.param(dict(do_cleanup=False, do_lowercasing=True, do_stop_word_removal=True, do_lemmatization=True),
+                 marks=pytest.mark.skipif(not nltk_resources_available(
+                     'tokenizers/punkt_tab', 'corpora/stopwords', 'corpora/wordnet',
+                     'taggers/averaged_perceptron_tagger_eng'), reason='NLTK resources are not installed'))]
+
+
+@pytest.mark.parametrize('preprocessing_flags', PREPROCESSING_FLAGS)
+def test_parallel_preprocessing_equals_serial(preprocessing_flags):
+    text_preprocessor = TextPreprocessor(download_resources=False)
+    serial = text_preprocessor.preprocess_batch(SENTENCES, batch_size=4, **preprocessing_flags)
+    parallel = text_preprocessor.preprocess_batch(iter(SENTENCES), batch_size=4, n_jobs=2, chunk_size=3,
+                                                  **preprocessing_flags)
+    assert parallel == serial
+    assert serial == [text_preprocessor.preprocess(sentence, **preprocessing_flags) for sentence in SENTENCES]
+
+
+def test_invalid_number_of_jobs():
+    with pytest.raises(ValueError):
+        TextPreprocessor(download_resources=False).preprocess_batch(SENTENCES, do_cleanup=True, n_jobs=0)